@@ -37,3 +37,13 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def inline_background(settings):
+    # фоновые задачи идут сразу после коммита: потоки пула переживают тест
+    settings.THUMBNAIL_WORKERS = 0
+    settings.TIMELINE_WORKERS = 0
@@ -0,0 +1,40 @@
+'''Фоновые пулы потоков для работы, которую не стоит делать в запросе.
+
+Каждый пул создаётся при первой задаче и живёт до конца процесса.
+Задачу ставят после коммита, чтобы поток видел записанные данные.
+'''
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+
+
+def submit(pool, workers, func, *args):
+    '''Выполняет ``func(*args)`` в пуле ``pool`` из ``workers`` потоков.
+
+    Возвращает ``Future`` задачи. При ``workers == 0`` пула нет: задача
+    выполняется сразу, возвращается ``None``.
+    '''
+    if not workers:
+        func(*args)
+        return None
+    executor = _executors.get(pool)
+    if executor is None:
+        executor = _executors.setdefault(
+            pool, ThreadPoolExecutor(workers, thread_name_prefix=pool)
+        )
+    return executor.submit(_work, func, args)
+
+
+def _work(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s%r упала', func.__name__, args)
+    finally:
+        # у потока пула своё соединение с базой
+        connections.close_all()
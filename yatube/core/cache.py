@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    quote_etag,
+)
+from django.utils.http import http_date
+
+
+def lock_key(key):
+    return f'{key}:rebuilding'
+
+
+def get_or_rebuild(key, rebuild, timeout, version=None, serve_stale=True):
+    '''Значение из кеша, которое пересобирает только один воркер.
+
+    В кеше лежит ``(version, expires_at, build_time, value)`` и живёт
+    ``timeout + STAMPEDE_GRACE`` секунд. Значение считается устаревшим,
+    когда сменилась ``version`` или истёк ``timeout``; кроме того, его
+    иногда пересобирают чуть раньше срока — тем вероятнее, чем дольше
+    сборка и ближе срок (probabilistic early recomputation). Устаревшее
+    значение пересобирает тот, кто первым взял блокировку, остальные
+    отдают старое. Блокировка живёт ``STAMPEDE_GRACE`` секунд, так что
+    старое значение отдаётся не дольше этого срока.
+
+    С ``serve_stale=False`` старое значение не отдаётся никогда: без
+    блокировки значение собирается заново. Так делает тот, кто сам
+    кладёт результат в кеш под новой версией, — иначе старое значение
+    прожило бы в нём весь срок.
+    '''
+    now = time.time()
+    entry = cache.get(key)
+    locked = False
+    if entry is not None:
+        stored_version, expires_at, build_time, value = entry
+        if stored_version == version and not _recompute_early(
+            expires_at, build_time, now
+        ):
+            return value
+        locked = cache.add(lock_key(key), True, settings.STAMPEDE_GRACE)
+        if not locked and serve_stale:
+            return value
+    started = time.time()
+    try:
+        value = rebuild()
+        build_time = time.time() - started
+        cache.set(
+            key,
+            (version, started + timeout, build_time, value),
+            timeout + settings.STAMPEDE_GRACE,
+        )
+    finally:
+        if locked:
+            cache.delete(lock_key(key))
+    return value
+
+
+def _recompute_early(expires_at, build_time, now):
+    # XFetch: -log(random) растёт редко, но неограниченно, поэтому
+    # ранняя пересборка случается у одного запроса из многих
+    return now - build_time * settings.STAMPEDE_BETA * math.log(
+        1 - random.random()
+    ) >= expires_at
+
+
+HOLE_RE = re.compile(r'<!--hole:([A-Za-z0-9_=-]+)-->')
+
+
+def hole_marker(template_name, context):
+    '''Метка на месте пользовательского фрагмента в общей странице.'''
+    raw = json.dumps([template_name, context])
+    return f'<!--hole:{base64.urlsafe_b64encode(raw.encode()).decode()}-->'
+
+
+def fill_holes(body, request, extra_context=None):
+    '''Дорисовывает в общей странице фрагменты текущего пользователя.'''
+
+    def render_hole(match):
+        template_name, context = json.loads(
+            base64.urlsafe_b64decode(match.group(1))
+        )
+        context.update(extra_context or {})
+        return render_to_string(template_name, context, request)
+
+    return HOLE_RE.sub(render_hole, body)
+
+
+def _etag(request, version):
+    return quote_etag(f'{version}.{request.user.pk or 0}')
+
+
+def conditional_response(request, version, last_modified, render):
+    '''Отвечает 304 на совпавшие валидаторы, иначе вызывает ``render``.
+
+    Ответ ``render`` может быть взят из кеша, собранного для прежней
+    версии: тогда в ``response.validators`` лежат его версия и время
+    изменения, и валидаторы строятся по ним. Пока ``render`` работает,
+    ``request.fresh_fragments`` не даёт ``{% singleflight_cache %}``
+    вставить в ответ старый фрагмент.
+    '''
+    modified = None
+    if last_modified is not None:
+        modified = last_modified(version)
+    response = get_conditional_response(
+        request, etag=_etag(request, version), last_modified=modified
+    )
+    if response is None:
+        request.fresh_fragments = True
+        try:
+            response = render()
+        finally:
+            request.fresh_fragments = False
+        version, modified = getattr(
+            response, 'validators', (version, modified)
+        )
+    response['ETag'] = _etag(request, version)
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    # браузер переспрашивает страницу, но с валидаторами
+    patch_cache_control(
+        response, no_cache=True, private=request.user.is_authenticated
+    )
+    return response
+
+
+def _render_shared_page(
+    view, hole_context, last_modified, request, version, args, kwargs
+):
+    '''Отдаёт страницу из общего кеша, дорисовывая фрагменты.
+
+    Вместе с телом хранятся версия и время изменения, для которых оно
+    собрано: кеш может отдать тело прежней версии.
+    '''
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'page:{view.__module__}.{view.__name__}:{digest}'
+
+    def build_shared():
+        request.shared_page = True
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            request.shared_page = False
+        modified = None
+        if last_modified is not None:
+            modified = last_modified(version)
+        return (
+            response['Content-Type'],
+            response.content.decode(),
+            version,
+            modified,
+        )
+
+    def fill(shared):
+        content_type, body, *validators = shared
+        extra = None
+        if hole_context is not None:
+            extra = hole_context(request, *args, **kwargs)
+        return (content_type, fill_holes(body, request, extra), *validators)
+
+    def build_guest(serve_stale=False):
+        return fill(
+            get_or_rebuild(
+                key,
+                build_shared,
+                settings.PAGE_CACHE_TIMEOUT,
+                version,
+                serve_stale=serve_stale,
+            )
+        )
+
+    if request.user.is_authenticated:
+        page = build_guest(serve_stale=True)
+    else:
+        # гостевая страница ляжет в кеш под новой версией
+        page = get_or_rebuild(
+            f'{key}:guest',
+            build_guest,
+            settings.PAGE_CACHE_TIMEOUT,
+            version,
+        )
+    content_type, body, *validators = page
+    response = HttpResponse(body, content_type=content_type)
+    response.validators = tuple(validators)
+    return response
+
+
+def shared_page(get_version, hole_context=None, last_modified=None):
+    '''Кеширует ответ view, общий для всех пользователей.
+
+    ``get_version(request, *args, **kwargs)`` дешево возвращает версию
+    данных страницы (и бросает Http404 для несуществующих объектов).
+    Страница рендерится с метками вместо тегов ``{% hole %}``, хранится
+    ``PAGE_CACHE_TIMEOUT`` по ключу путь+query и пересобирается одним
+    воркером при смене версии. Гости получают целиком собранную
+    страницу из кеша, авторизованные — общую страницу, в которой
+    фрагменты дорисованы для них; ``hole_context`` дополняет контекст
+    этих фрагментов.
+
+    Версия же служит валидатором условного GET: ETag — версия плюс
+    пользователь (фрагменты у каждого свои), ``last_modified(version)``
+    даёт Last-Modified. На совпавший If-None-Match/If-Modified-Since
+    отвечаем 304, не трогая ни кеш страниц, ни запросы view. Если кеш
+    отдал страницу прежней версии, валидаторы — её собственные.
+    '''
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            version = get_version(request, *args, **kwargs)
+            return conditional_response(
+                request,
+                version,
+                last_modified,
+                lambda: _render_shared_page(
+                    view,
+                    hole_context,
+                    last_modified,
+                    request,
+                    version,
+                    args,
+                    kwargs,
+                ),
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core import checks
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    '''Версии лент и общие страницы живут в кеше — он должен быть общим.'''
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        checks.Warning(
+            f'Кеш {backend} свой у каждого процесса: запись в одном воркере '
+            'не сбросит страницы, закешированные другими.',
+            hint='Задайте общий кеш через CACHE_BACKEND и CACHE_LOCATION.',
+            id='core.W001',
+        )
+    ]
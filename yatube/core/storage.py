@@ -0,0 +1,40 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''Хранилище, где имя файла — sha256 его содержимого.
+
+    ``posts/photo.webp`` ложится в ``posts/ab/ab…(64 знака).webp``.
+    Одинаковое содержимое получает одно имя, поэтому повторная загрузка
+    не пишет второй файл, а миниатюры sorl (они зависят от имени
+    исходника) режутся один раз на все посты с этой картинкой.
+    Файл могут делить несколько записей — удалять его можно только
+    когда на него никто не ссылается.
+    '''
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        name = posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+        if self.exists(name):
+            # свежий mtime не даст collect_media забрать файл, на который
+            # сейчас сошлётся новый пост
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
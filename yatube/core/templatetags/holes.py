@@ -0,0 +1,43 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.cache import hole_marker
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+    def __init__(self, template_name, extra_context):
+        self.template_name = template_name
+        self.extra_context = extra_context
+
+    def render(self, context):
+        template_name = self.template_name.resolve(context)
+        values = {
+            name: var.resolve(context)
+            for name, var in self.extra_context.items()
+        }
+        request = context.get('request')
+        if getattr(request, 'shared_page', False):
+            return mark_safe(hole_marker(template_name, values))
+        nested = context.template.engine.get_template(template_name)
+        with context.push(**values):
+            return nested.render(context)
+
+
+@register.tag('hole')
+def do_hole(parser, token):
+    '''Фрагмент, который у каждого пользователя свой.
+
+    ``{% hole 'includes/header.html' post_id=post.pk %}`` работает как
+    ``{% include %}``, а в общей странице из ``shared_page`` оставляет
+    метку; шаблон дорисовывается отдельно для каждого запроса, поэтому
+    параметры должны быть простыми значениями (они идут через JSON).
+    '''
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag takes at least one argument."
+        )
+    extra_context = template.base.token_kwargs(bits[2:], parser)
+    return HoleNode(parser.compile_filter(bits[1]), extra_context)
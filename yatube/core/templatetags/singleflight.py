@@ -0,0 +1,62 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core.cache import get_or_rebuild
+
+register = template.Library()
+
+
+class SingleFlightCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        version = self.version.resolve(context) if self.version else None
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        # ответ conditional_response подписан текущей версией, а общая
+        # страница из shared_page ещё и хранится под ней: старый
+        # фрагмент застрял бы в них
+        request = context.get('request')
+        return get_or_rebuild(
+            key,
+            lambda: self.nodelist.render(context),
+            int(timeout),
+            version=version,
+            serve_stale=not getattr(request, 'fresh_fragments', False),
+        )
+
+
+@register.tag('singleflight_cache')
+def do_singleflight_cache(parser, token):
+    '''Как ``{% cache %}``, но без давки при протухании фрагмента.
+
+    ``{% singleflight_cache 3600 name vary_on... version=feed_version %}``
+    Смена ``version`` не создаёт новый ключ, а помечает фрагмент
+    устаревшим: его пересобирает один запрос, остальные недолго
+    отдают прежний. В ответе ``conditional_response`` (и общей странице
+    ``shared_page``) прежний фрагмент не отдаётся — ответ пересобирает
+    его сам.
+    '''
+    nodelist = parser.parse(('endsingleflight_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 2 arguments."
+        )
+    version = None
+    if bits[-1].startswith('version='):
+        version = parser.compile_filter(bits.pop()[len('version='):])
+    return SingleFlightCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+        version,
+    )
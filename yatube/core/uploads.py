@@ -0,0 +1,94 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+
+
+def sniff_format(header):
+    '''Формат картинки по первым байтам файла или ``None``.'''
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    '''Пишет загрузку во временный файл и обрывает её как можно раньше.
+
+    Запрос с заведомо большим Content-Length не читается дальше
+    заголовка файла; файл больше ``MAX_IMAGE_UPLOAD_SIZE`` обрывается
+    на том куске, где превысил лимит; по первым байтам проверяется
+    сигнатура формата, а по заголовку картинки — число пикселей
+    (``MAX_IMAGE_PIXELS``). Причина отказа остаётся в
+    ``request.upload_error``: файла в ``request.FILES`` не будет.
+    '''
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # кроме файла в теле могут быть только обычные поля формы
+        self.request_too_large = content_length > (
+            settings.MAX_IMAGE_UPLOAD_SIZE
+            + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        )
+
+    def new_file(self, *args, **kwargs):
+        if self.request_too_large:
+            self.reject_size()
+        super().new_file(*args, **kwargs)
+        self.header = b''
+        self.header_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.reject_size()
+        if not self.header_checked:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, raw_data):
+        self.header += raw_data
+        if len(self.header) < 12:
+            return
+        if sniff_format(self.header) is None:
+            self.reject('Загрузите картинку в JPEG, PNG, GIF или WebP.')
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.reject_pixels()
+        except Exception:
+            # заголовок JPEG может идти после длинного EXIF — ждём ещё
+            if len(self.header) < settings.UPLOAD_HEADER_SIZE:
+                return
+            self.reject('Не удалось прочитать размеры картинки.')
+        self.header = b''
+        self.header_checked = True
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            self.reject_pixels()
+
+    def reject_size(self):
+        limit = filesizeformat(settings.MAX_IMAGE_UPLOAD_SIZE)
+        self.reject(f'Картинка должна быть не больше {limit}.')
+
+    def reject_pixels(self):
+        megapixels = settings.MAX_IMAGE_PIXELS // 10 ** 6
+        self.reject(f'Картинка должна быть не больше {megapixels} Мп.')
+
+    def reject(self, message):
+        self.request.upload_error = message
+        # остаток тела не читаем: воркер сразу свободен
+        raise StopUpload(connection_reset=True)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import matching
 
 
 @admin.register(Post)
@@ -17,5 +18,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # вместо LIKE '%…%' по всем постам — полнотекстовый индекс
+        if not search_term.strip():
+            return queryset, False
+        return matching(queryset, search_term), False
+
 
 admin.site.register(Group)
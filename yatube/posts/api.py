@@ -0,0 +1,105 @@
+'''JSON API лент только для чтения, версия 1.
+
+Те же ленты, что ``index``, ``group_posts``, ``profile`` и
+``follow_index``, но без шаблонов: посты читаются через ``values()``
+только нужными столбцами и сериализуются из словарей, объекты моделей
+не создаются. Листание — по курсору ``?cursor=``, ответ версионируется
+той же версией ленты, что и HTML-страница, и отдаёт 304 по ETag.
+'''
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from core.cache import conditional_response
+
+from .caching import (
+    INDEX_FEED,
+    author_feed,
+    feed_version,
+    group_feed,
+    version_timestamp,
+)
+from .models import Group, Post, User, post_image_storage
+from .paginators import CursorPaginator
+from .timeline import FollowTimeline
+
+# имя поля в ответе и что читать для него через values()
+POST_FIELDS = (
+    ('id', 'pk'),
+    ('text', 'text'),
+    ('pub_date', 'pub_date'),
+    ('author', 'author__username'),
+    ('group', 'group__slug'),
+    ('image', 'image'),
+    ('image_width', 'image_width'),
+    ('image_height', 'image_height'),
+    ('comments_count', 'comments_count'),
+)
+POST_COLUMNS = tuple(column for _, column in POST_FIELDS)
+
+
+def serialize_post(row):
+    post = {name: row[column] for name, column in POST_FIELDS}
+    if post['image']:
+        post['image'] = post_image_storage.url(post['image'])
+    else:
+        post['image'] = None
+    return post
+
+
+def feed_response(request, source, version):
+    '''Страница ленты ``source`` в JSON с условным GET по ``version``.'''
+
+    def render_page():
+        page_obj = CursorPaginator(source, settings.NUM_POSTS).cursor_page(
+            request.GET.get('cursor')
+        )
+        return JsonResponse(
+            {
+                'results': [serialize_post(row) for row in page_obj],
+                'next_cursor': page_obj.next_cursor,
+                'previous_cursor': page_obj.previous_cursor,
+            }
+        )
+
+    return conditional_response(
+        request, version, version_timestamp, render_page
+    )
+
+
+def index(request):
+    return feed_response(
+        request,
+        Post.objects.values(*POST_COLUMNS),
+        feed_version(INDEX_FEED),
+    )
+
+
+def group_posts(request, slug):
+    group_id = get_object_or_404(
+        Group.objects.values_list('pk', flat=True), slug=slug
+    )
+    return feed_response(
+        request,
+        Post.objects.filter(group_id=group_id).values(*POST_COLUMNS),
+        feed_version(group_feed(group_id)),
+    )
+
+
+def profile(request, username):
+    author_id = get_object_or_404(
+        User.objects.values_list('pk', flat=True), username=username
+    )
+    return feed_response(
+        request,
+        Post.objects.filter(author_id=author_id).values(*POST_COLUMNS),
+        feed_version(author_feed(author_id)),
+    )
+
+
+def follow_index(request):
+    if not request.user.is_authenticated:
+        # клиенту API нужен статус, а не редирект на форму входа
+        return JsonResponse({'detail': 'Требуется вход.'}, status=401)
+    timeline = FollowTimeline(request.user, fields=POST_COLUMNS)
+    return feed_response(request, timeline, feed_version(*timeline.feeds))
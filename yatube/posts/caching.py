@@ -0,0 +1,92 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+INDEX_FEED = 'index'
+
+
+def group_feed(group_id):
+    return f'group:{group_id}'
+
+
+def author_feed(author_id):
+    return f'author:{author_id}'
+
+
+def follow_feed(user_id):
+    return f'follow:{user_id}'
+
+
+def post_page(post_id):
+    '''Страница поста с комментариями — тоже версионируется.'''
+    return f'post:{post_id}'
+
+
+def post_feeds(post, group_id=None):
+    '''Ленты, в которых виден пост (с учётом его прежней группы).'''
+    feeds = [INDEX_FEED, author_feed(post.author_id)]
+    for pk in {post.group_id, group_id} - {None}:
+        feeds.append(group_feed(pk))
+    return feeds
+
+
+def feed_count_key(feed):
+    return f'posts:count:{feed}'
+
+
+def get_feed_count(feed, count):
+    '''Число постов ленты из кеша; ``count`` считает его при промахе.'''
+    key = feed_count_key(feed)
+    value = cache.get(key)
+    if value is None:
+        value = count()
+        cache.set(key, value, settings.FEED_COUNT_TIMEOUT)
+    return value
+
+
+def forget_feed_counts(feeds):
+    cache.delete_many([feed_count_key(feed) for feed in feeds])
+
+
+def feed_version_key(feed):
+    return f'posts:version:{feed}'
+
+
+def _new_version():
+    # версия — время последней записи в миллисекундах: так после
+    # вытеснения ключа она не начнётся заново с уже занятого значения,
+    # а заодно годится для Last-Modified
+    return int(time.time() * 1000)
+
+
+def feed_version(*feeds):
+    '''Текущая версия лент для ключей кеша фрагментов.
+
+    Версия меняется при любой записи, которая видна в ленте, поэтому
+    фрагменты можно хранить часами: после записи ключ просто другой.
+    '''
+    keys = [feed_version_key(feed) for feed in feeds]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump_feed_versions(feeds):
+    for feed in feeds:
+        key = feed_version_key(feed)
+        now = _new_version()
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            version = None
+        if version is None or version < now:
+            cache.set(key, now, None)
+
+
+def version_timestamp(version):
+    '''Время последней записи в ленты версии ``feed_version``.'''
+    return max(int(part) for part in version.split('.')) // 1000
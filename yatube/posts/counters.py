@@ -0,0 +1,97 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Group, MediaFile, Post
+
+
+def change(queryset, field, delta):
+    '''Сдвигает счётчик на ``delta`` одним UPDATE без чтения строки.
+
+    Уменьшение не уводит счётчик ниже нуля: рассинхрон лечит
+    ``manage.py recount_counters``, а не IntegrityError в запросе.
+    '''
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_author(user_id, field, delta):
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if change(stats, field, delta) or delta < 0:
+        return
+    _, created = AuthorStats.objects.get_or_create(
+        user_id=user_id, defaults={field: delta}
+    )
+    if not created:
+        change(stats, field, delta)
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post(post_id, delta):
+    change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def change_media(name, delta):
+    if not name:
+        return
+    files = MediaFile.objects.filter(name=name)
+    if change(files, 'refs', delta) or delta < 0:
+        return
+    _, created = MediaFile.objects.get_or_create(
+        name=name, defaults={'refs': delta}
+    )
+    if not created:
+        change(files, 'refs', delta)
+
+
+def _count(queryset, field):
+    '''Подзапрос «сколько строк queryset ссылается на внешний объект».'''
+    counted = (
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted), 0)
+
+
+# модель счётчика -> {поле: выражение для пересчёта}
+RECOUNTS = (
+    (
+        AuthorStats,
+        {
+            'posts_count': _count(Post.objects.all(), 'author'),
+            'followers_count': _count(Follow.objects.all(), 'author'),
+            'following_count': _count(Follow.objects.all(), 'user'),
+        },
+    ),
+    (Group, {'posts_count': _count(Post.objects.all(), 'group')}),
+    (MediaFile, {'refs': _count(Post.objects.all(), 'image')}),
+    (Post, {'comments_count': _count(Comment.objects.all(), 'post')}),
+)
+
+
+def recount(model, expressions, chunk_size):
+    '''Пересчитывает счётчики модели кусками по ``chunk_size`` ключей.
+
+    Каждый кусок — отдельный короткий UPDATE по диапазону первичного
+    ключа, поэтому таблица не блокируется на всё время пересчёта.
+    Возвращает число обработанных строк.
+    '''
+    total = 0
+    last_pk = None
+    pks = model.objects.order_by('pk').values_list('pk', flat=True)
+    while True:
+        chunk = pks if last_pk is None else pks.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return total
+        last_pk = chunk[-1]
+        total += model.objects.filter(
+            pk__gte=chunk[0], pk__lte=last_pk
+        ).update(**expressions)
@@ -0,0 +1,128 @@
+'''RSS и Atom (``?format=atom``) для сайта, сообществ и авторов.
+
+Ленты отдаются через ``shared_page`` с той же версией, что и HTML-
+страницы: XML собирается заново только после записи поста в эту
+ленту, а опрос читалки без изменений стоит чтения версии из кеша
+и ответа 304.
+'''
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.template.defaultfilters import linebreaksbr
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.text import Truncator
+
+from core.cache import shared_page
+
+from .caching import version_timestamp
+from .models import Group, Post, User
+from .views import group_version, index_version, profile_version
+
+FEED_TYPES = {'rss': Rss201rev2Feed, 'atom': Atom1Feed}
+
+
+class PostsFeed(Feed):
+    '''Последние посты всего сайта.'''
+
+    def __init__(self, feed_type=Rss201rev2Feed):
+        # экземпляр создаётся на запрос, формат можно держать в нём
+        self.feed_type = feed_type
+
+    def title(self, obj):
+        return 'Yatube: последние записи'
+
+    def link(self, obj):
+        return reverse('posts:index')
+
+    def description(self, obj):
+        return 'Новые записи всех авторов'
+
+    def subtitle(self, obj):
+        # в Atom описание ленты называется subtitle
+        return self.description(obj)
+
+    def items(self, obj):
+        return Post.objects.select_related('author', 'group')[
+            :settings.FEED_ITEMS
+        ]
+
+    def item_title(self, item):
+        return Truncator(item.text).chars(60)
+
+    def item_description(self, item):
+        return linebreaksbr(item.text, autoescape=True)
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=[item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group_id else []
+
+
+class GroupPostsFeed(PostsFeed):
+    '''Последние посты сообщества.'''
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def link(self, group):
+        return reverse('posts:group_list', args=[group.slug])
+
+    def description(self, group):
+        return group.description
+
+    def items(self, group):
+        return group.posts.select_related('author', 'group')[
+            :settings.FEED_ITEMS
+        ]
+
+
+class AuthorPostsFeed(PostsFeed):
+    '''Последние посты автора.'''
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, author):
+        return f'Yatube: {author.get_full_name() or author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', args=[author.username])
+
+    def description(self, author):
+        return f'Записи пользователя {author.username}'
+
+    def items(self, author):
+        return author.posts.select_related('author', 'group')[
+            :settings.FEED_ITEMS
+        ]
+
+
+def syndicate(feed_class, request, **kwargs):
+    feed_type = FEED_TYPES.get(request.GET.get('format'), Rss201rev2Feed)
+    return feed_class(feed_type)(request, **kwargs)
+
+
+@shared_page(index_version, last_modified=version_timestamp)
+def index_feed(request):
+    return syndicate(PostsFeed, request)
+
+
+@shared_page(group_version, last_modified=version_timestamp)
+def group_feed(request, slug):
+    return syndicate(GroupPostsFeed, request, slug=slug)
+
+
+@shared_page(profile_version, last_modified=version_timestamp)
+def profile_feed(request, username):
+    return syndicate(AuthorPostsFeed, request, username=username)
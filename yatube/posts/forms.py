@@ -1,4 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+
+from . import images
 from .models import Comment, Post
 
 
@@ -16,6 +20,22 @@ class PostForm(forms.ModelForm):
             'image': 'Изображение поста',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if image is False:
+            self.instance.image_width = self.instance.image_height = None
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            image, width, height = images.normalize(image)
+        except (OSError, Image.DecompressionBombError) as error:
+            raise forms.ValidationError(
+                'Не удалось обработать картинку.'
+            ) from error
+        self.instance.image_width = width
+        self.instance.image_height = height
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,94 @@
+'''Приведение загруженных картинок постов к ограниченному виду.'''
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, ImageSequence, features
+
+EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+
+def output_format():
+    '''WebP, если его умеет установленный Pillow, иначе JPEG.'''
+    if settings.POST_IMAGE_FORMAT == 'WEBP' and features.check('webp'):
+        return 'WEBP'
+    return 'JPEG'
+
+
+def normalize(upload):
+    '''Пересохраняет загруженную картинку для хранения.
+
+    Поворачивает по EXIF, уменьшает до ``POST_IMAGE_MAX_SIZE`` по большей
+    стороне и кодирует в ``output_format()`` без метаданных (кроме
+    цветового профиля). Анимация так же обрабатывается покадрово и
+    остаётся анимированным WebP; в JPEG сохраняется первый кадр.
+    Возвращает файл, его ширину и высоту.
+    '''
+    max_size = (settings.POST_IMAGE_MAX_SIZE,) * 2
+    image_format = output_format()
+    options = {'quality': settings.POST_IMAGE_QUALITY}
+    upload.seek(0)
+    with Image.open(upload) as source:
+        icc_profile = source.info.get('icc_profile')
+        if getattr(source, 'is_animated', False) and image_format == 'WEBP':
+            frames, animation = _frames(source, max_size)
+            image = frames[0]
+            options.update(
+                animation, save_all=True, append_images=frames[1:]
+            )
+        else:
+            # JPEG декодируется сразу в уменьшенном масштабе
+            source.draft('RGB', max_size)
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail(max_size, Image.LANCZOS)
+            image = _convert(image, image_format)
+    if image_format == 'JPEG':
+        options.update(optimize=True, progressive=True)
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    normalized = SimpleUploadedFile(
+        stem + EXTENSIONS[image_format],
+        buffer.getvalue(),
+        content_type=f'image/{image_format.lower()}',
+    )
+    return normalized, image.width, image.height
+
+
+def _frames(source, max_size):
+    '''Уменьшенные кадры анимации и её длительности.
+
+    Все кадры вместе не больше ``MAX_IMAGE_PIXELS``: размер первого
+    кадра проверен при загрузке, но не их число.
+    '''
+    if source.n_frames * source.width * source.height > (
+        settings.MAX_IMAGE_PIXELS
+    ):
+        raise Image.DecompressionBombError(
+            f'{source.n_frames} кадров {source.width}×{source.height}'
+        )
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(source):
+        durations.append(frame.info.get('duration', 100))
+        frame = ImageOps.exif_transpose(frame).convert('RGBA')
+        frame.thumbnail(max_size, Image.LANCZOS)
+        frames.append(frame)
+    return frames, {'duration': durations, 'loop': source.info.get('loop', 0)}
+
+
+def _convert(image, image_format):
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    if not has_alpha:
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    if image_format == 'WEBP':
+        return image
+    # у JPEG нет прозрачности — кладём на белый фон
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
@@ -0,0 +1,80 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from posts import api, views
+from posts.models import Group, Post
+
+# отдельный кеш в памяти: замер не трогает рабочий кеш
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-feeds',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает, сколько стоит собрать страницу ленты в HTML '
+        'и в JSON API, без кеша.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Сколько раз собирать каждую страницу.',
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author').first()
+        if post is None:
+            self.stdout.write('Нет постов — нечего замерять.')
+            return
+        feeds = [
+            ('index', views.index, api.index, {}),
+            (
+                'profile',
+                views.profile,
+                api.profile,
+                {'username': post.author.username},
+            ),
+        ]
+        group = Group.objects.filter(posts__isnull=False).first()
+        if group is not None:
+            feeds.append(
+                (
+                    'group',
+                    views.group_posts,
+                    api.group_posts,
+                    {'slug': group.slug},
+                )
+            )
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            for name, html_view, json_view, kwargs in feeds:
+                html = self.measure(html_view, kwargs, options['requests'])
+                json = self.measure(json_view, kwargs, options['requests'])
+                self.stdout.write(
+                    f'{name}: HTML {html * 1000:.2f} мс, '
+                    f'API {json * 1000:.2f} мс, '
+                    f'в {html / json:.1f} раза быстрее'
+                )
+
+    @staticmethod
+    def measure(view, kwargs, requests):
+        '''Среднее время сборки страницы без кеша, в секундах.'''
+        factory = RequestFactory()
+        elapsed = 0
+        for _ in range(requests):
+            cache.clear()
+            request = factory.get('/')
+            request.user = AnonymousUser()
+            started = time.perf_counter()
+            view(request, **kwargs)
+            elapsed += time.perf_counter() - started
+        return elapsed / requests
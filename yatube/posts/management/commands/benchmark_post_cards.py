@@ -0,0 +1,132 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine, engines
+from django.utils import timezone
+
+from posts.models import Group, Post, User
+
+# карточка до тега post_card: три {% url %} и {% include %} на пост
+LEGACY_POST = '''{% load post_images %}
+<ul>
+    {% if profile %}
+    <li>
+        Автор: {{ post.author.get_full_name }}
+        <a href="{% url 'posts:profile' post.author %}">
+        все записи пользователя</a>
+    </li>
+    {% endif %}
+    <li>
+      Дата публикации: {{ post.pub_date|date:"d M Y"}}
+    </li>
+  </ul>
+  {% post_image post %}
+  <p>
+  {{post.text|linebreaksbr}}
+  </p>
+  <a href="{% url 'posts:post_detail' post.id %}">
+  подробная информация </a> <br>
+  {% if post.group and group_list %}
+    <a href="{% url 'posts:group_list' post.group.slug %}">
+    все записи группы</a>
+  {% endif %}
+  {% if not forloop.last %}<hr>{% endif %}
+'''
+LEGACY_PAGE = (
+    '{% for post in page_obj %}'
+    "{% include 'legacy/post.html' with profile=True group_list=True %}"
+    '{% endfor %}'
+)
+CARD_PAGE = (
+    '{% load post_cards %}'
+    '{% for post in page_obj %}'
+    '{% post_card post profile=True group_list=True %}'
+    '{% endfor %}'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает отрисовку страницы из NUM_POSTS карточек постов '
+        'через {% include %} и через тег post_card.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=500,
+            help='Сколько раз отрисовать страницу.',
+        )
+
+    def handle(self, *args, **options):
+        # оба варианта идут через один движок с кеширующим загрузчиком,
+        # как в продакшене: сравниваются теги, а не загрузка шаблонов
+        engine = Engine(
+            dirs=engines['django'].engine.dirs,
+            loaders=[
+                (
+                    'django.template.loaders.cached.Loader',
+                    [
+                        (
+                            'django.template.loaders.locmem.Loader',
+                            {
+                                'legacy/post.html': LEGACY_POST,
+                                'legacy/page.html': LEGACY_PAGE,
+                                'cards/page.html': CARD_PAGE,
+                            },
+                        ),
+                        'django.template.loaders.filesystem.Loader',
+                        'django.template.loaders.app_directories.Loader',
+                    ],
+                )
+            ],
+            libraries={
+                'post_cards': 'posts.templatetags.post_cards',
+                'post_images': 'posts.templatetags.post_images',
+            },
+        )
+        posts = self.page()
+        legacy = self.measure(
+            lambda: engine.get_template('legacy/page.html'),
+            posts,
+            options['pages'],
+        )
+        cards = self.measure(
+            lambda: engine.get_template('cards/page.html'),
+            posts,
+            options['pages'],
+        )
+        self.stdout.write(
+            f'{len(posts)} карточек: include {legacy * 1000:.2f} мс, '
+            f'post_card {cards * 1000:.2f} мс, '
+            f'в {legacy / cards:.1f} раза быстрее'
+        )
+
+    @staticmethod
+    def page():
+        '''Страница ленты в памяти: база для замера не нужна.'''
+        group = Group(pk=1, title='Группа', slug='group')
+        authors = [
+            User(pk=number, username=f'author{number}', first_name='Автор')
+            for number in range(3)
+        ]
+        return [
+            Post(
+                pk=number,
+                text=f'Пост {number}\nвторая строка',
+                pub_date=timezone.now(),
+                author=authors[number % len(authors)],
+                group=group,
+            )
+            for number in range(settings.NUM_POSTS)
+        ]
+
+    @staticmethod
+    def measure(get_template, posts, pages):
+        '''Среднее время отрисовки страницы, в секундах.'''
+        started = time.perf_counter()
+        for _ in range(pages):
+            get_template().render(Context({'page_obj': posts}))
+        return (time.perf_counter() - started) / pages
@@ -0,0 +1,163 @@
+import os
+import posixpath
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import MediaFile, Post
+
+
+def stored_names(storage, directory):
+    '''Имена файлов каталога хранилища в лексикографическом порядке.
+
+    Каталог сравнивается как ``имя/`` — так порядок совпадает
+    с ``ORDER BY`` по полным путям. В памяти только один листинг
+    на уровень вложенности.
+    '''
+    directories, files = storage.listdir(directory)
+    entries = sorted(
+        [(name + '/', True) for name in directories]
+        + [(name, False) for name in files]
+    )
+    for entry, is_directory in entries:
+        path = posixpath.join(directory, entry.rstrip('/'))
+        if is_directory:
+            yield from stored_names(storage, path)
+        else:
+            yield path
+
+
+def unreferenced(stored, referenced):
+    '''Слияние двух отсортированных потоков: файлы без ссылок.'''
+    reference = next(referenced, None)
+    for name in stored:
+        while reference is not None and reference < name:
+            reference = next(referenced, None)
+        if reference != name:
+            yield name
+
+
+class Command(BaseCommand):
+    help = (
+        'Убирает в карантин (или удаляет) картинки, на которые не ссылается '
+        'ни один пост, вместе с их миниатюрами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Удалять файлы, а не переносить в карантин.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что было бы убрано.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help=(
+                'Не трогать файлы моложе стольких часов: их пост может '
+                'быть ещё не сохранён.'
+            ),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов убирать за раз.',
+        )
+        parser.add_argument(
+            '--quarantine',
+            default='quarantine',
+            help='Каталог карантина внутри MEDIA_ROOT.',
+        )
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        self.storage = field.storage
+        self.options = options
+        self.cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        referenced = (
+            Post.objects.exclude(image='')
+            .order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+            .iterator()
+        )
+        directory = field.upload_to.rstrip('/')
+        if not self.storage.exists(directory):
+            return
+        total = 0
+        batch = []
+        for name in unreferenced(
+            stored_names(self.storage, directory), referenced
+        ):
+            if self.storage.get_modified_time(name) > self.cutoff:
+                continue
+            batch.append(name)
+            if len(batch) >= options['batch_size']:
+                total += self.collect(batch)
+                batch = []
+        total += self.collect(batch)
+        action = 'удалено' if options['delete'] else 'в карантине'
+        if options['dry_run']:
+            action = 'найдено'
+        self.stdout.write(f'Файлов без ссылок {action}: {total}')
+
+    def still_unreferenced(self, names):
+        '''Файлы из ``names``, на которые никто не ссылается и сейчас.
+
+        Между листингом и переносом пачки повторная загрузка того же
+        содержимого могла сослаться на файл: она обновляет его mtime,
+        увеличивает счётчик ``MediaFile`` и сохраняет пост.
+        '''
+        referenced = set(
+            Post.objects.filter(image__in=names).values_list(
+                'image', flat=True
+            )
+        )
+        referenced.update(
+            MediaFile.objects.filter(name__in=names, refs__gt=0).values_list(
+                'name', flat=True
+            )
+        )
+        return [
+            name
+            for name in names
+            if name not in referenced
+            and self.storage.get_modified_time(name) <= self.cutoff
+        ]
+
+    def collect(self, names):
+        with transaction.atomic():
+            # строки счётчиков заблокированы до конца пачки: новая ссылка
+            # на файл дождётся её и не потеряется
+            list(MediaFile.objects.select_for_update().filter(name__in=names))
+            names = self.still_unreferenced(names)
+            if self.options['dry_run']:
+                for name in names:
+                    self.stdout.write(name)
+                return len(names)
+            for name in names:
+                # миниатюры и записи sorl о них больше не нужны
+                default.kvstore.delete(ImageFile(name))
+                if self.options['delete']:
+                    self.storage.delete(name)
+                else:
+                    self.move_to_quarantine(name)
+            MediaFile.objects.filter(name__in=names, refs=0).delete()
+        return len(names)
+
+    def move_to_quarantine(self, name):
+        target = self.storage.path(
+            posixpath.join(self.options['quarantine'], name)
+        )
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self.storage.path(name), target)
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.counters import RECOUNTS, recount
+from posts.models import AuthorStats, MediaFile, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики постов, комментариев, подписок '
+        'и ссылок на картинки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать за один UPDATE.',
+        )
+
+    def handle(self, *args, **options):
+        missing = User.objects.filter(stats__isnull=True).values_list(
+            'pk', flat=True
+        )
+        AuthorStats.objects.bulk_create(
+            AuthorStats(user_id=pk) for pk in missing.iterator()
+        )
+        images = (
+            Post.objects.exclude(image='')
+            .exclude(image__in=MediaFile.objects.values('name'))
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        MediaFile.objects.bulk_create(
+            MediaFile(name=name) for name in images.iterator()
+        )
+        for model, expressions in RECOUNTS:
+            total = recount(model, expressions, options['chunk_size'])
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: пересчитано {total}'
+            )
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.caching import bump_feed_versions, post_feeds, post_page
+from posts.models import Post
+
+
+def _init_worker():
+    # при spawn дочерний процесс стартует без настроенного Django
+    django.setup()
+
+
+def _regenerate(name):
+    try:
+        thumbnails.generate_image(name)
+    except Exception as error:
+        return name, repr(error)
+    return name, None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нарезает заново миниатюры всех картинок постов '
+        'в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Сколько постов читать из базы за один запрос.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Сколько процессов режут картинки (0 — в этом процессе).',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=None,
+            help='Не больше стольких картинок в секунду.',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=0,
+            help='Начать с постов с id больше этого.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help=(
+                'Файл, где хранится id последнего обработанного поста: '
+                'прерванный запуск продолжится с него.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        last_pk = max(
+            options['start_after'], self.read_checkpoint(options['checkpoint'])
+        )
+        posts = Post.objects.exclude(image='').order_by('pk')
+        total = posts.filter(pk__gt=last_pk).count()
+        self.stdout.write(f'Картинок к нарезке: {total}, с id > {last_pk}')
+        pool = None
+        if options['processes']:
+            # дочерние процессы не должны делить соединения с родителем
+            connections.close_all()
+            pool = multiprocessing.Pool(
+                options['processes'], initializer=_init_worker
+            )
+        try:
+            self.run(posts, last_pk, total, pool, options)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def run(self, posts, last_pk, total, pool, options):
+        done = failed = 0
+        started = time.monotonic()
+        while True:
+            chunk = list(
+                posts.filter(pk__gt=last_pk).only(
+                    'pk', 'image', 'author_id', 'group_id'
+                )[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+            names = [post.image.name for post in chunk]
+            if pool is None:
+                results = map(_regenerate, names)
+            else:
+                results = pool.imap(_regenerate, names)
+            for name, error in results:
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+            # страницы с заглушками вместо миниатюр пересоберутся
+            feeds = {post_page(post.pk) for post in chunk}
+            for post in chunk:
+                feeds.update(post_feeds(post))
+            bump_feed_versions(feeds)
+            last_pk = chunk[-1].pk
+            done += len(chunk)
+            self.write_checkpoint(options['checkpoint'], last_pk)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{done}/{total}, id {last_pk}, '
+                f'{done / max(elapsed, 1e-6):.1f} картинок/с'
+            )
+            if options['max_rate']:
+                time.sleep(max(done / options['max_rate'] - elapsed, 0))
+        self.stdout.write(f'Готово: {done}, с ошибками: {failed}')
+
+    @staticmethod
+    def read_checkpoint(path):
+        if path is None or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    @staticmethod
+    def write_checkpoint(path, pk):
+        if path is None:
+            return
+        # через временный файл: прерванная запись не испортит отметку
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            checkpoint.write(str(pk))
+        os.replace(temporary, path)
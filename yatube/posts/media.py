@@ -0,0 +1,74 @@
+'''Отдача медиафайлов: проверки в Django, байты — через веб-сервер.
+
+Django решает, можно ли отдать файл, и отвечает заголовком
+``X-Accel-Redirect`` (nginx) или ``X-Sendfile`` (Apache, lighttpd) —
+сам файл читает и отправляет веб-сервер, воркер Python свободен сразу.
+Без ``MEDIA_SENDFILE`` файл отдаёт Django, как ``static()`` в разработке.
+'''
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from .models import MediaFile
+
+# имя, которое даёт ContentAddressedStorage: содержимое под ним не меняется
+CONTENT_ADDRESSED_RE = re.compile(r'^posts/([0-9a-f]{2})/\1[0-9a-f]{62}\.\w+$')
+
+
+def serve_media(request, path):
+    '''Отдаёт файл из ``MEDIA_ROOT``, если он кому-то нужен.
+
+    Миниатюры sorl отдаются всегда, картинки постов — пока на них
+    ссылается хоть один пост. Остальное в ``MEDIA_ROOT`` (карантин
+    сборщика мусора, служебные файлы) наружу не видно.
+    '''
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not is_public(path) or not os.path.isfile(full_path):
+        raise Http404
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_PREFIX + path
+        )
+    elif settings.MEDIA_SENDFILE == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        response = FileResponse(
+            open(full_path, 'rb'), content_type=content_type
+        )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_cache_control(response, public=True, **cache_policy(path))
+    return response
+
+
+def is_public(path):
+    if path.startswith(thumbnail_settings.THUMBNAIL_PREFIX):
+        return True
+    if path.startswith('posts/'):
+        return MediaFile.objects.filter(name=path, refs__gt=0).exists()
+    return False
+
+
+def cache_policy(path):
+    '''Файлы, имя которых выведено из содержимого, кешируются навсегда.'''
+    immutable = path.startswith(
+        thumbnail_settings.THUMBNAIL_PREFIX
+    ) or CONTENT_ADDRESSED_RE.match(path)
+    if immutable:
+        return {'max_age': settings.MEDIA_IMMUTABLE_MAX_AGE, 'immutable': True}
+    return {'max_age': settings.MEDIA_MAX_AGE}
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.19 on 2026-10-18 04:33
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_media_files(apps, schema_editor):
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    Post = apps.get_model('posts', 'Post')
+    images = (
+        Post.objects.exclude(image='')
+        .order_by()
+        .values('image')
+        .annotate(refs=Count('pk'))
+    )
+    MediaFile.objects.bulk_create(
+        MediaFile(name=row['image'], refs=row['refs'])
+        for row in images.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_image_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
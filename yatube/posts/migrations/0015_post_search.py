@@ -0,0 +1,65 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:10
+
+from django.db import migrations
+
+# индекс хранит только токены: сам текст читается из posts_post
+CREATE_INDEX = '''
+    CREATE VIRTUAL TABLE posts_post_search USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+
+# триггеры, а не сигналы: индекс обновляется и при bulk_create,
+# update() и каскадном удалении
+CREATE_TRIGGERS = [
+    '''
+    CREATE TRIGGER posts_post_search_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(rowid, text)
+        VALUES (new.id, new.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_post_search_delete AFTER DELETE ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(posts_post_search, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    ''',
+    '''
+    CREATE TRIGGER posts_post_search_update AFTER UPDATE OF text
+    ON posts_post
+    BEGIN
+        INSERT INTO posts_post_search(posts_post_search, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_search(rowid, text)
+        VALUES (new.id, new.text);
+    END
+    ''',
+]
+
+REBUILD_INDEX = (
+    "INSERT INTO posts_post_search(posts_post_search) VALUES ('rebuild')"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [CREATE_INDEX, *CREATE_TRIGGERS, REBUILD_INDEX],
+            [
+                'DROP TRIGGER posts_post_search_insert',
+                'DROP TRIGGER posts_post_search_delete',
+                'DROP TRIGGER posts_post_search_update',
+                'DROP TABLE posts_post_search',
+            ],
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
+# одинаковые картинки хранятся одним файлом, см. MediaFile
+post_image_storage = ContentAddressedStorage()
+
 
 class Post(models.Model):
     SYMBOL_POST_QUANTITY = 15
@@ -27,12 +32,43 @@ class Post(models.Model):
         verbose_name='Группа',
         help_text='Группа, к которой будет относиться пост',
     )
-    image = models.ImageField('Картинка', upload_to='posts/', blank=True)
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        blank=True,
+        storage=post_image_storage,
+    )
+    # размеры записывает форма после обработки загрузки; width_field
+    # не годится — он открывает файл при каждой загрузке поста из базы
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name='Ширина картинки'
+    )
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name='Высота картинки'
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Комментариев'
+    )
 
     class Meta:
         verbose_name_plural = 'Посты'
         verbose_name = 'Пост'
         ordering = ('-pub_date',)
+        # ленты сортируются по (pub_date, id) после фильтра по автору или
+        # группе; SQLite читает такие индексы в обратном порядке
+        indexes = [
+            models.Index(fields=['pub_date', 'id'], name='post_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_date_idx',
+            ),
+            # collect_media читает ссылки на картинки по порядку имён
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         '''Возвращает строковое представление модели'''
@@ -47,6 +83,9 @@ class Group(models.Model):
     )
     slug = models.SlugField(unique=True, verbose_name='Слаг')
     description = models.TextField(verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Постов'
+    )
 
     class Meta:
         verbose_name_plural = 'Группы'
@@ -81,6 +120,14 @@ class Comment(models.Model):
         auto_now_add=True, verbose_name='Дата публикации'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx',
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -112,3 +159,88 @@ class Follow(models.Model):
                 )
             ),
         ]
+
+
+class AuthorStats(models.Model):
+    '''Счётчики пользователя, которые обновляются вместе с записями.'''
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Постов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок'
+    )
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+        verbose_name = 'Счётчики пользователя'
+
+
+class MediaFile(models.Model):
+    '''Файл картинки в хранилище и число постов, которые на него ссылаются.
+
+    Счётчик обновляется сигналами вместе с постами; файл без ссылок
+    больше не нужен ни одному посту.
+    '''
+
+    name = models.CharField(
+        max_length=100, primary_key=True, verbose_name='Имя файла'
+    )
+    refs = models.PositiveIntegerField(default=0, verbose_name='Ссылок')
+
+    class Meta:
+        verbose_name_plural = 'Файлы картинок'
+        verbose_name = 'Файл картинки'
+
+    def __str__(self):
+        return self.name
+
+
+class TimelineEntry(models.Model):
+    '''Запись ленты подписок читателя (fan-out on write).
+
+    При публикации поста запись кладётся каждому подписчику автора,
+    поэтому страница ``/follow/`` читается диапазоном по индексу
+    ``(user, pub_date, post)`` без соединения с Follow.
+    '''
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    # копия Post.pub_date, чтобы сортировать по индексу ленты
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name_plural = 'Записи лент'
+        verbose_name = 'Запись ленты'
+        ordering = ('-pub_date', '-post_id')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_post'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_date_idx',
+            ),
+        ]
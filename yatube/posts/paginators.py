@@ -0,0 +1,251 @@
+import base64
+import binascii
+import datetime
+import json
+from functools import partial, reduce
+from operator import or_
+
+from django.core.paginator import Page, Paginator
+from django.utils.functional import cached_property
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from .caching import get_feed_count
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def keyset_filter(ordering, values, reverse=False):
+    '''Условие «строго после курсора» для составного ключа.
+
+    ``(a, b) < (x, y)`` раскрывается в ``a < x OR (a = x AND b < y)``.
+    '''
+    conditions = []
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        lookup = f'{name}__{"lt" if descending else "gt"}'
+        equal = {
+            prev.lstrip('-'): value
+            for prev, value in zip(ordering[:position], values[:position])
+        }
+        conditions.append(Q(**equal, **{lookup: values[position]}))
+    return reduce(or_, conditions)
+
+
+class CachedCountPaginator(Paginator):
+    '''Paginator, который берёт число постов ленты из кеша.
+
+    ``feed`` — имя ленты из ``posts.caching``; счётчик сбрасывается
+    сигналами при создании и удалении постов. Без ``feed`` считает как
+    обычный ``Paginator``. ``max_pages`` ограничивает номера страниц:
+    дальше ленту листают по курсору.
+    '''
+
+    def __init__(
+        self, object_list, per_page, feed=None, max_pages=None, **kwargs
+    ):
+        super().__init__(object_list, per_page, **kwargs)
+        self.feed = feed
+        self.max_pages = max_pages
+
+    @cached_property
+    def count(self):
+        count = Paginator.count.func
+        if self.feed is None:
+            return count(self)
+        return get_feed_count(self.feed, lambda: count(self))
+
+    @cached_property
+    def num_pages(self):
+        num_pages = Paginator.num_pages.func(self)
+        if self.max_pages is None:
+            return num_pages
+        return min(num_pages, self.max_pages)
+
+    @property
+    def truncated(self):
+        '''Есть ли посты дальше последней номерной страницы.'''
+        return self.count > self.num_pages * self.per_page
+
+    def page_window(self, number, on_each_side=2):
+        '''Номера страниц для навигации: первая, последняя и ``on_each_side``
+        вокруг текущей. ``None`` обозначает пропуск.
+        '''
+        first = max(number - on_each_side, 1)
+        last = min(number + on_each_side, self.num_pages)
+        window = list(range(first, last + 1))
+        if first > 2:
+            window.insert(0, None)
+        if first > 1:
+            window.insert(0, 1)
+        if last < self.num_pages - 1:
+            window.append(None)
+        if last < self.num_pages:
+            window.append(self.num_pages)
+        return window
+
+
+class CursorPage(Page):
+    '''Страница keyset-пагинации.
+
+    Совместима с шаблонами, написанными под обычный ``Page``: номер
+    страницы неизвестен, зато есть курсоры на соседние страницы.
+    '''
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def next_page_number(self):
+        return None
+
+    def previous_page_number(self):
+        return None
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class LazyCursor:
+    '''Курсор на страницу после номерной ``page``.
+
+    Что следующая страница есть, известно по числу постов, а для
+    курсора нужна последняя строка страницы. Курсор кодируется при
+    первом чтении как строки, поэтому страница, отданная из кеша
+    фрагментов, своих постов не запрашивает.
+    '''
+
+    def __init__(self, paginator, page):
+        self.paginator = paginator
+        self.page = page
+
+    @cached_property
+    def value(self):
+        return self.paginator.encode_cursor(self.page[len(self.page) - 1])
+
+    def __str__(self):
+        return self.value
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __hash__(self):
+        return hash(self.value)
+
+
+class CursorPaginator(Paginator):
+    '''Пагинация по ключу сортировки вместо OFFSET.
+
+    ``ordering`` задаёт поля ключа (по умолчанию ``-pub_date, -pk``),
+    последнее поле должно быть уникальным. Курсор — непрозрачная
+    base64-строка со значениями ключа крайнего объекта страницы и
+    направлением. Страница любой глубины читается одним запросом
+    с ``LIMIT`` по индексу, без ``COUNT(*)`` и ``OFFSET``.
+    '''
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk')):
+        self.ordering = tuple(ordering)
+        if hasattr(object_list, 'order_by'):
+            object_list = object_list.order_by(*self.ordering)
+        super().__init__(object_list, per_page)
+
+    def encode_cursor(self, obj, reverse=False):
+        # строки values() — словари, объекты моделей — атрибуты
+        get = obj.get if isinstance(obj, dict) else partial(getattr, obj)
+        values = [get(field.lstrip('-')) for field in self.ordering]
+        # isoformat, а не DjangoJSONEncoder: тот отрезает микросекунды
+        values = [
+            value.isoformat() if isinstance(value, datetime.date) else value
+            for value in values
+        ]
+        raw = json.dumps([reverse, values])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            reverse, values = json.loads(base64.urlsafe_b64decode(padded))
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            model = self.object_list.model
+            values = [
+                self._get_field(model, field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            # ключ сортировки не бывает пустым, сравнение с NULL ложно
+            if any(value is None for value in values):
+                raise InvalidCursor(cursor)
+        except (
+            binascii.Error, ValueError, TypeError, ValidationError
+        ) as error:
+            raise InvalidCursor(cursor) from error
+        return bool(reverse), values
+
+    def _get_field(self, model, field):
+        name = field.lstrip('-')
+        # вычисляемые поля ключа (ранг поиска) источник описывает сам
+        cursor_fields = getattr(self.object_list, 'cursor_fields', {})
+        if name in cursor_fields:
+            return cursor_fields[name]
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+    def keyset_slice(self, values, reverse, limit):
+        '''Возвращает до ``limit`` объектов после курсора ``values``.'''
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(
+                keyset_filter(self.ordering, values, reverse)
+            )
+        if reverse:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+    def cursor_page(self, cursor):
+        '''Возвращает страницу после курсора.
+
+        Пустой или испорченный курсор даёт первую страницу — так же
+        снисходительно, как ``Paginator.get_page`` к номеру страницы.
+        Источник, умеющий ``keyset_slice`` сам (например, слитая лента
+        подписок), читается через него, а не через ``filter``.
+        '''
+        reverse, values = False, None
+        if cursor:
+            try:
+                reverse, values = self.decode_cursor(cursor)
+            except InvalidCursor:
+                pass
+        source = self.object_list
+        if not hasattr(source, 'keyset_slice'):
+            source = self
+        objects = source.keyset_slice(values, reverse, self.per_page + 1)
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if reverse:
+            objects.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = values is not None, has_more
+        next_cursor = previous_cursor = None
+        if objects and has_next:
+            next_cursor = self.encode_cursor(objects[-1])
+        if objects and has_previous:
+            previous_cursor = self.encode_cursor(objects[0], reverse=True)
+        return CursorPage(objects, self, next_cursor, previous_cursor)
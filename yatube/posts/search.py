@@ -0,0 +1,98 @@
+'''Полнотекстовый поиск по постам через индекс SQLite FTS5.
+
+Индекс ``posts_post_search`` (миграция 0015) хранит только токены
+текста и обновляется триггерами на ``posts_post``. Запрос идёт по
+инвертированному индексу: стоимость зависит от числа совпадений,
+а не от размера таблицы, как у ``LIKE '%…%'``.
+'''
+import re
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+SEARCH_ORDERING = ('rank', 'pk')
+
+# больше слов в запросе не берём: каждое — отдельный проход по индексу
+MAX_TERMS = 10
+# слова короче ищутся целиком: префикс из двух букв совпадёт почти со всем
+MIN_PREFIX_LENGTH = 3
+
+WORD_RE = re.compile(r'\w+')
+
+
+def fts_query(text):
+    '''Запрос FTS5 из пользовательского ввода или ``None``.
+
+    Синтаксис FTS5 (кавычки, ``NEAR``, ``OR``, ``-``) наружу не
+    открыт: каждое слово берётся в кавычки, длинные слова ищутся по
+    префиксу — «кот» найдёт и «котики». Слова соединяются через AND.
+    '''
+    terms = []
+    for word in WORD_RE.findall(text or '')[:MAX_TERMS]:
+        term = f'"{word}"'
+        if len(word) >= MIN_PREFIX_LENGTH:
+            term += '*'
+        terms.append(term)
+    return ' '.join(terms) or None
+
+
+def matching(queryset, text):
+    '''Посты ``queryset``, в тексте которых есть все слова ``text``.'''
+    query = fts_query(text)
+    if query is None:
+        return queryset.none()
+    return queryset.filter(
+        pk__in=RawSQL(
+            'SELECT rowid FROM posts_post_search '
+            'WHERE posts_post_search MATCH %s',
+            [query],
+        )
+    )
+
+
+class SearchResults:
+    '''Найденные посты по убыванию релевантности (BM25).
+
+    Источник для ``CursorPaginator`` с ключом ``SEARCH_ORDERING``:
+    ``rank`` — оценка bm25 (чем меньше, тем лучше), ``pk`` разбивает
+    равенства. Страница — один запрос к индексу с ``LIMIT`` и один
+    ``in_bulk`` за постами, без ``COUNT(*)`` и ``OFFSET``.
+    '''
+
+    model = Post
+    cursor_fields = {'rank': models.FloatField()}
+
+    def __init__(self, text):
+        self.query = fts_query(text)
+
+    def keyset_slice(self, values, reverse, limit):
+        '''Первые ``limit`` найденных постов после ключа ``values``.'''
+        if self.query is None:
+            return []
+        sql = (
+            'SELECT rowid, rank FROM posts_post_search '
+            'WHERE posts_post_search MATCH %s'
+        )
+        params = [self.query]
+        direction, compare = ('DESC', '<') if reverse else ('ASC', '>')
+        if values is not None:
+            sql += f' AND (rank, rowid) {compare} (%s, %s)'
+            params.extend(values)
+        sql += f' ORDER BY rank {direction}, rowid {direction} LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranks = cursor.fetchall()
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [pk for pk, _ in ranks]
+        )
+        results = []
+        for pk, rank in ranks:
+            post = posts.get(pk)
+            # пост могли удалить между двумя запросами
+            if post is not None:
+                post.rank = rank
+                results.append(post)
+        return results
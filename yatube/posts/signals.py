@@ -0,0 +1,195 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from . import counters, timeline
+from .caching import (
+    INDEX_FEED,
+    author_feed,
+    bump_feed_versions,
+    follow_feed,
+    forget_feed_counts,
+    group_feed,
+    post_feeds,
+    post_page,
+)
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    # группу и картинку можно сменить при редактировании — запомним старые
+    instance._previous_group_id = instance._previous_image = None
+    if instance.pk is not None:
+        previous = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image')
+            .first()
+        )
+        if previous is not None:
+            instance._previous_group_id, instance._previous_image = previous
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    with transaction.atomic():
+        if created:
+            counters.change_author(instance.author_id, 'posts_count', 1)
+            counters.change_group(instance.group_id, 1)
+            counters.change_media(instance.image.name, 1)
+            forget_feed_counts(post_feeds(instance))
+            return
+        if instance._previous_group_id != instance.group_id:
+            counters.change_group(instance._previous_group_id, -1)
+            counters.change_group(instance.group_id, 1)
+            forget_feed_counts(
+                post_feeds(instance, instance._previous_group_id)
+            )
+        if instance._previous_image != instance.image.name:
+            counters.change_media(instance._previous_image, -1)
+            counters.change_media(instance.image.name, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    with transaction.atomic():
+        counters.change_author(instance.author_id, 'posts_count', -1)
+        counters.change_group(instance.group_id, -1)
+        counters.change_media(instance.image.name, -1)
+    forget_feed_counts(post_feeds(instance))
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        with transaction.atomic():
+            counters.change_author(instance.author_id, 'followers_count', 1)
+            counters.change_author(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    with transaction.atomic():
+        counters.change_author(instance.author_id, 'followers_count', -1)
+        counters.change_author(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump_follow_versions(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.trim(instance.user_id, instance.author_id)
+    # счётчик подписчиков уже уменьшен в count_deleted_follow
+    timeline.catch_up_demoted(instance.author_id)
+    bump_follow_versions(instance)
+
+
+def bump_follow_versions(follow):
+    # профили обоих показывают счётчики подписок
+    bump_feed_versions(
+        [
+            follow_feed(follow.user_id),
+            author_feed(follow.user_id),
+            author_feed(follow.author_id),
+        ]
+    )
+
+
+@receiver(post_save, sender=Post)
+def bump_saved_post(sender, instance, created, **kwargs):
+    bump_feed_versions(
+        post_feeds(instance, instance._previous_group_id)
+        + [post_page(instance.pk)]
+    )
+    if not created:
+        # новый пост сбросит ленты подписчиков при раздаче
+        timeline.touch_followers(instance)
+
+
+@receiver(post_delete, sender=Post)
+def bump_deleted_post(sender, instance, **kwargs):
+    bump_feed_versions(post_feeds(instance) + [post_page(instance.pk)])
+    timeline.touch_followers(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_post(sender, instance, **kwargs):
+    bump_feed_versions([post_page(instance.post_id)])
+
+
+def group_pages(group_id):
+    '''Ленты и страницы постов, где видны название и ссылка группы.
+
+    Кроме самих лент возвращает авторов постов группы: их подписчики
+    видят те же карточки в своих лентах.
+    '''
+    posts = Post.objects.filter(group_id=group_id).order_by()
+    author_ids = list(posts.values_list('author_id', flat=True).distinct())
+    feeds = [group_feed(group_id), INDEX_FEED]
+    feeds += [author_feed(author_id) for author_id in author_ids]
+    feeds += [post_page(pk) for pk in posts.values_list('pk', flat=True)]
+    return feeds, author_ids
+
+
+def bump_group_pages(feeds, author_ids):
+    bump_feed_versions(feeds)
+    for author_id in author_ids:
+        timeline.touch_author_followers(author_id)
+
+
+@receiver(post_save, sender=Group)
+def bump_saved_group(sender, instance, created, **kwargs):
+    if created:
+        bump_feed_versions([group_feed(instance.pk)])
+        return
+    # переименование или новый slug видны в карточках всех постов группы;
+    # группы правят редко, поэтому сбрасываем их все
+    bump_group_pages(*group_pages(instance.pk))
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_pages(sender, instance, **kwargs):
+    # после удаления посты уже без группы — запомним, где она была видна
+    instance._group_pages = group_pages(instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+def bump_deleted_group(sender, instance, **kwargs):
+    bump_group_pages(*instance._group_pages)
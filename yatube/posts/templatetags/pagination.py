@@ -0,0 +1,12 @@
+from django import template
+from django.conf import settings
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page_obj, on_each_side=None):
+    '''Окно номеров страниц вокруг текущей вместо всего page_range.'''
+    if on_each_side is None:
+        on_each_side = settings.PAGE_WINDOW
+    return page_obj.paginator.page_window(page_obj.number, on_each_side)
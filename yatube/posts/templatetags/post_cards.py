@@ -0,0 +1,46 @@
+from django import template
+from django.urls import reverse
+
+from .post_images import post_image
+
+register = template.Library()
+
+
+def _url(context, name, arg):
+    '''``reverse`` один раз за отрисовку страницы на пару имя+аргумент.
+
+    Автор и группа повторяются от поста к посту, поэтому на странице
+    ленты ``reverse`` вызывается по разу на пост и на каждого автора
+    и группу, а не трижды на каждый пост.
+    '''
+    urls = context.render_context.setdefault('post_card_urls', {})
+    key = (name, arg)
+    if key not in urls:
+        urls[key] = reverse(name, args=[arg])
+    return urls[key]
+
+
+@register.inclusion_tag('includes/post.html', takes_context=True)
+def post_card(context, post, profile=False, group_list=False):
+    '''Карточка поста в ленте.
+
+    Шаблон компилируется один раз на тег, ссылки и картинка считаются
+    здесь, в Python, а в шаблон приходят готовыми строками.
+    '''
+    forloop = context.get('forloop')
+    group_url = None
+    if group_list and post.group_id:
+        group_url = _url(context, 'posts:group_list', post.group.slug)
+    return {
+        'post': post,
+        'profile': profile,
+        'author_url': (
+            _url(context, 'posts:profile', post.author.username)
+            if profile
+            else None
+        ),
+        'detail_url': _url(context, 'posts:post_detail', post.pk),
+        'group_url': group_url,
+        'image': post_image(context, post),
+        'last': forloop['last'] if forloop else True,
+    }
@@ -0,0 +1,52 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_image(context, post, sizes=None, css_class='card-img my-2'):
+    '''Картинка поста с ``srcset`` из готовых размеров.
+
+    Пока миниатюры нарезают, выводит заглушку с пропорциями картинки.
+    В ленте берёт миниатюры из прочитанных разом ``page_obj.thumbnails``.
+    '''
+    if not post.image:
+        return ''
+    ready = [
+        thumbnail
+        for thumbnail in (
+            _thumbnail(context, post, variant)
+            for variant in settings.POST_IMAGE_SRCSET
+        )
+        if thumbnail is not None
+    ]
+    if not ready:
+        largest = settings.POST_THUMBNAILS[settings.POST_IMAGE_SRCSET[-1]]
+        width, height = largest[0].split('x')
+        return format_html(
+            '<div class="{} bg-light" style="aspect-ratio: {} / {}"></div>',
+            css_class,
+            width,
+            height,
+        )
+    srcset = ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in ready
+    )
+    return format_html(
+        '<img class="{}" src="{}" srcset="{}" sizes="{}" alt="">',
+        css_class,
+        ready[-1].url,
+        srcset,
+        sizes or settings.POST_IMAGE_SIZES,
+    )
+
+
+def _thumbnail(context, post, variant):
+    prefetched = getattr(context.get('page_obj'), 'thumbnails', None)
+    if prefetched is not None:
+        return prefetched.get(post.image, variant)
+    return thumbnails.lookup(post.image, variant)
@@ -0,0 +1,152 @@
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models.signals import post_init
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class FeedApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.reader = User.objects.create_user(username='Женя')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(
+                author=cls.author,
+                text=f'Пост {number}',
+                group=cls.group if number % 2 else None,
+            )
+            for number in range(settings.NUM_POSTS + 5)
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def walk(self, client, url):
+        data = client.get(url).json()
+        seen = [post['id'] for post in data['results']]
+        while data['next_cursor']:
+            data = client.get(url, {'cursor': data['next_cursor']}).json()
+            seen.extend(post['id'] for post in data['results'])
+        return seen
+
+    def test_feeds_match_html_order(self):
+        '''Ленты API отдают те же посты и в том же порядке, что HTML.'''
+        posts = Post.objects.order_by('-pub_date', '-pk')
+        feeds = (
+            (reverse('posts:api_index'), posts, self.guest_client),
+            (
+                reverse('posts:api_group_posts', args=[self.group.slug]),
+                posts.filter(group=self.group),
+                self.guest_client,
+            ),
+            (
+                reverse('posts:api_profile', args=[self.author.username]),
+                posts.filter(author=self.author),
+                self.guest_client,
+            ),
+            (reverse('posts:api_follow_index'), posts, self.reader_client),
+        )
+        for url, expected, client in feeds:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.walk(client, url),
+                    list(expected.values_list('pk', flat=True)),
+                )
+
+    def test_post_fields(self):
+        '''Пост в ответе — плоский словарь без вложенных объектов.'''
+        post = Post.objects.filter(group=self.group).latest('pub_date')
+        data = self.guest_client.get(
+            reverse('posts:api_group_posts', args=[self.group.slug])
+        ).json()
+        self.assertEqual(
+            data['results'][0],
+            {
+                'id': post.pk,
+                'text': post.text,
+                'pub_date': data['results'][0]['pub_date'],
+                'author': 'Mokrushin',
+                'group': 'test-slug',
+                'image': None,
+                'image_width': None,
+                'image_height': None,
+                'comments_count': 0,
+            },
+        )
+        self.assertIsNone(data['previous_cursor'])
+
+    def test_no_model_instances_are_built(self):
+        '''Страница API сериализуется из values(), без объектов Post.'''
+        built = []
+
+        def count(sender, **kwargs):
+            built.append(sender)
+
+        post_init.connect(count, sender=Post)
+        try:
+            for url, client in (
+                (reverse('posts:api_index'), self.guest_client),
+                (reverse('posts:api_follow_index'), self.reader_client),
+            ):
+                response = client.get(url)
+                self.assertEqual(
+                    len(response.json()['results']), settings.NUM_POSTS
+                )
+        finally:
+            post_init.disconnect(count, sender=Post)
+        self.assertEqual(built, [])
+
+    def test_etag(self):
+        '''304 до новой записи в ленте.'''
+        url = reverse('posts:api_index')
+        etag = self.guest_client.get(url)['ETag']
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed_needs_login(self):
+        '''Без входа — 401, а не редирект на форму.'''
+        response = self.guest_client.get(reverse('posts:api_follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=0)
+    def test_follow_feed_merges_pulled_posts(self):
+        '''Посты «знаменитостей» сливаются и в строках values().'''
+        celebrity = User.objects.create_user(username='Звезда')
+        Follow.objects.create(user=self.reader, author=celebrity)
+        star_post = Post.objects.create(author=celebrity, text='Звезда')
+        seen = self.walk(
+            self.reader_client, reverse('posts:api_follow_index')
+        )
+        self.assertEqual(seen[0], star_post.pk)
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_benchmark(self):
+        '''Замер сравнивает HTML и API для каждой ленты.'''
+        output = StringIO()
+        call_command('benchmark_feeds', requests=1, stdout=output)
+        for feed in ('index', 'profile', 'group'):
+            self.assertIn(f'{feed}: HTML', output.getvalue())
@@ -0,0 +1,132 @@
+from xml.etree import ElementTree
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Group, Post
+
+User = get_user_model()
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+
+
+@override_settings(FEED_ITEMS=3)
+class SyndicationFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.other = User.objects.create_user(username='Женя')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа', slug='other', description='Описание'
+        )
+        for number in range(4):
+            Post.objects.create(
+                author=cls.author,
+                text=f'Пост <{number}>\nвторая строка',
+                group=cls.group,
+            )
+        Post.objects.create(
+            author=cls.other, text='Чужой пост', group=cls.other_group
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+
+    def rss_items(self, url):
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/'))
+        return ElementTree.fromstring(response.content).findall(
+            'channel/item'
+        )
+
+    def test_feeds_list_latest_posts_of_scope(self):
+        '''В каждой ленте последние FEED_ITEMS постов своей области.'''
+        feeds = (
+            (reverse('posts:index_feed'), Post.objects.all()),
+            (
+                reverse('posts:group_feed', args=[self.group.slug]),
+                self.group.posts.all(),
+            ),
+            (
+                reverse('posts:profile_feed', args=[self.other.username]),
+                self.other.posts.all(),
+            ),
+        )
+        for url, posts in feeds:
+            with self.subTest(url=url):
+                links = [item.findtext('link') for item in self.rss_items(url)]
+                expected = [
+                    'http://testserver'
+                    + reverse('posts:post_detail', args=[post.pk])
+                    for post in posts.order_by('-pub_date')[:3]
+                ]
+                self.assertEqual(links, expected)
+
+    def test_item_text_is_escaped(self):
+        '''Текст поста попадает в описание экранированным.'''
+        item = self.rss_items(reverse('posts:index_feed'))[1]
+        self.assertEqual(
+            item.findtext('description'), 'Пост &lt;3&gt;<br>вторая строка'
+        )
+
+    def test_atom_format(self):
+        '''?format=atom отдаёт ту же ленту в Atom.'''
+        response = self.guest_client.get(
+            reverse('posts:group_feed', args=[self.group.slug]),
+            {'format': 'atom'},
+        )
+        feed = ElementTree.fromstring(response.content)
+        self.assertEqual(feed.findtext(f'{ATOM}subtitle'), 'Тестовое описание')
+        self.assertEqual(len(feed.findall(f'{ATOM}entry')), 3)
+
+    def test_poll_without_changes_is_304_from_cache(self):
+        '''Повторный опрос без изменений — 304 без запросов к базе.'''
+        url = reverse('posts:index_feed')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_feed_is_rebuilt_only_after_write_in_scope(self):
+        '''Новый пост меняет ленты своей области и не трогает чужие.'''
+        urls = {
+            'group': reverse('posts:group_feed', args=[self.group.slug]),
+            'other': reverse('posts:profile_feed', args=[self.other.username]),
+        }
+        etags = {
+            name: self.guest_client.get(url)['ETag']
+            for name, url in urls.items()
+        }
+        post = Post.objects.create(
+            author=self.author, text='Свежий пост', group=self.group
+        )
+        response = self.guest_client.get(
+            urls['group'], HTTP_IF_NONE_MATCH=etags['group']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, reverse('posts:post_detail', args=[post.pk])
+        )
+        response = self.guest_client.get(
+            urls['other'], HTTP_IF_NONE_MATCH=etags['other']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_group(self):
+        '''У несуществующего сообщества ленты нет.'''
+        response = self.guest_client.get(
+            reverse('posts:group_feed', args=['missing'])
+        )
+        self.assertEqual(response.status_code, 404)
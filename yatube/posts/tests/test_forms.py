@@ -1,17 +1,20 @@
+import os
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
-
-from ..models import Comment, Group, Post
+from ..models import Comment, Group, MediaFile, Post
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+STORED_NAME_RE = r'^posts/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}\.{}$'
 
 User = get_user_model()
 
@@ -82,7 +85,9 @@ class TestCreateForm(TestCase):
         self.assertEqual(object.text, form_data['text'])
         self.assertEqual(object.group.id, form_data['group'])
         self.assertEqual(object.author, self.post.author)
-        self.assertEqual(object.image.name, f'posts/{uploaded}')
+        # картинки пересохраняются в WebP под именем-хешем содержимого
+        self.assertRegex(object.image.name, STORED_NAME_RE.format('webp'))
+        self.assertEqual((object.image_width, object.image_height), (2, 1))
 
     def test_form_update(self):
         '''Проверка редактирования поста через форму на странице.'''
@@ -145,3 +150,185 @@ class TestCreateForm(TestCase):
             + '?next='
             + reverse('posts:add_comment', kwargs={'post_id': post.id}),
         )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIZE=100)
+class TestImageNormalization(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Мокрушин')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def upload(self, size, image_format='JPEG', mode='RGB', **options):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, image_format, **options)
+        extension = image_format.lower()
+        return SimpleUploadedFile(
+            f'photo.{extension}',
+            buffer.getvalue(),
+            content_type=f'image/{extension}',
+        )
+
+    def create(self, image):
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Фото', 'image': image}
+        )
+        return Post.objects.get(text='Фото')
+
+    def test_large_photo_is_downscaled_without_exif(self):
+        '''Большое фото уменьшается, поворачивается и теряет EXIF.'''
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+        exif[0x010F] = 'Camera'
+        post = self.create(self.upload((400, 200), exif=exif.tobytes()))
+        self.assertRegex(post.image.name, STORED_NAME_RE.format('webp'))
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (50, 100))
+            self.assertFalse(stored.getexif())
+
+    @override_settings(POST_IMAGE_FORMAT='JPEG')
+    def test_transparent_image_falls_back_to_jpeg(self):
+        '''Без WebP прозрачная картинка сохраняется в JPEG.'''
+        post = self.create(self.upload((60, 40), 'PNG', 'RGBA'))
+        self.assertRegex(post.image.name, STORED_NAME_RE.format('jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (60, 40))
+
+    def animation(self, size, frames=3):
+        return self.upload(
+            size,
+            'GIF',
+            save_all=True,
+            append_images=[
+                Image.new('RGB', size, color)
+                for color in ('green', 'blue', 'white')[: frames - 1]
+            ],
+            duration=[100, 200, 300][:frames],
+            loop=0,
+        )
+
+    def test_large_animation_is_downscaled_by_frame(self):
+        '''Большая анимация уменьшается покадрово и остаётся анимацией.'''
+        post = self.create(self.animation((300, 150)))
+        self.assertRegex(post.image.name, STORED_NAME_RE.format('webp'))
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.n_frames, 3)
+            self.assertEqual(stored.size, (100, 50))
+            self.assertFalse(stored.getexif())
+
+    @override_settings(MAX_IMAGE_PIXELS=2 * 300 * 150)
+    def test_animation_over_pixel_budget_is_rejected(self):
+        '''Кадры анимации вместе не больше MAX_IMAGE_PIXELS.'''
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Фото', 'image': self.animation((300, 150))},
+        )
+        self.assertFormError(
+            response, 'form', 'image', 'Не удалось обработать картинку.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_identical_uploads_share_one_file(self):
+        '''Одинаковые картинки хранятся одним файлом со счётчиком ссылок.'''
+        first = self.create(self.upload((80, 60)))
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Репост', 'image': self.upload((80, 60))},
+        )
+        second = Post.objects.get(text='Репост')
+        self.assertEqual(first.image.name, second.image.name)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+        self.assertEqual(MediaFile.objects.get(name=first.image.name).refs, 2)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    MAX_IMAGE_UPLOAD_SIZE=20 * 1024,
+    MAX_IMAGE_PIXELS=10 ** 6,
+)
+class TestUploadLimits(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Мокрушин')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    @staticmethod
+    def png(size, noise=False):
+        image = Image.new('L', size)
+        if noise:
+            image = Image.frombytes('L', size, os.urandom(size[0] * size[1]))
+        buffer = BytesIO()
+        image.save(buffer, 'PNG')
+        return SimpleUploadedFile(
+            'photo.png', buffer.getvalue(), content_type='image/png'
+        )
+
+    def assertRejected(self, image, message):
+        response = self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Пост', 'image': image}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn(message, response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.filter(text='Пост').exists())
+
+    def test_oversized_file_is_rejected(self):
+        '''Файл больше лимита обрывается, пост не создаётся.'''
+        self.assertRejected(self.png((200, 200), noise=True), 'не больше')
+
+    def test_oversized_file_without_other_fields_is_rejected(self):
+        '''Форма из одного большого файла показывает ошибку, а не падает.'''
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'image': self.png((200, 200), noise=True)},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn(
+            'не больше', response.context['form'].errors['image'][0]
+        )
+
+    def test_too_many_pixels_are_rejected_by_header(self):
+        '''Картинка с огромным числом пикселей отсекается по заголовку.'''
+        self.assertRejected(self.png((2000, 1000)), 'Мп')
+
+    def test_not_an_image_is_rejected_by_magic_bytes(self):
+        '''Файл не-картинка отсекается по первым байтам.'''
+        fake = SimpleUploadedFile(
+            'photo.png', b'<?php echo "hello"; ?>', content_type='image/png'
+        )
+        self.assertRejected(fake, 'JPEG, PNG, GIF или WebP')
+
+    def test_small_image_passes(self):
+        '''Картинка в пределах лимитов сохраняется.'''
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Пост', 'image': self.png((100, 50))},
+        )
+        self.assertTrue(Post.objects.get(text='Пост').image)
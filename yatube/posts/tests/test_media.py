@@ -0,0 +1,231 @@
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from PIL import Image
+
+from .. import thumbnails
+from ..management.commands import collect_media
+from ..models import MediaFile, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+User = get_user_model()
+
+
+def nginx(response):
+    '''Заглушка nginx: выполняет internal-редирект X-Accel-Redirect.'''
+    location = unquote(response['X-Accel-Redirect'])
+    prefix = settings.MEDIA_ACCEL_PREFIX
+    assert location.startswith(prefix), location
+    path = os.path.join(settings.MEDIA_ROOT, location[len(prefix):])
+    with open(path, 'rb') as served:
+        return served.read()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.content = b'image bytes'
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост с картинкой',
+            image=ContentFile(cls.content, name='photo.webp'),
+        )
+        cls.url = settings.MEDIA_URL + cls.post.image.name
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        self.guest_client = Client()
+
+    def test_django_serves_file_without_sendfile(self):
+        '''Без MEDIA_SENDFILE файл отдаёт сам Django.'''
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_nginx_sends_bytes_after_checks(self):
+        '''С X-Accel-Redirect Django не отдаёт байты, это делает nginx.'''
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(nginx(response), self.content)
+
+    @override_settings(MEDIA_SENDFILE='x-sendfile')
+    def test_x_sendfile_header(self):
+        '''X-Sendfile указывает на файл в MEDIA_ROOT.'''
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.post.image.path)
+
+    def test_content_addressed_files_are_cached_forever(self):
+        '''Файлы с именем-хешем кешируются надолго и без проверок.'''
+        thumbnail = os.path.join(TEMP_MEDIA_ROOT, 'cache', 'ab', 'thumb.jpg')
+        os.makedirs(os.path.dirname(thumbnail), exist_ok=True)
+        with open(thumbnail, 'wb') as file:
+            file.write(b'thumbnail')
+        for url in (self.url, settings.MEDIA_URL + 'cache/ab/thumb.jpg'):
+            with self.subTest(url=url):
+                cache_control = self.guest_client.get(url)['Cache-Control']
+                self.assertIn('immutable', cache_control)
+                self.assertIn(
+                    f'max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}',
+                    cache_control,
+                )
+
+    def test_unreferenced_and_foreign_files_are_hidden(self):
+        '''Картинки удалённых постов и чужие файлы наружу не отдаются.'''
+        other = Post.objects.create(
+            author=self.author,
+            text='Удалённый пост',
+            image=ContentFile(b'deleted', name='deleted.webp'),
+        )
+        deleted_url = settings.MEDIA_URL + other.image.name
+        other.delete()
+        for url in (
+            deleted_url,
+            settings.MEDIA_URL + 'posts/../../manage.py',
+            settings.MEDIA_URL + 'quarantine/photo.webp',
+            settings.MEDIA_URL + 'posts/missing.webp',
+        ):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 404)
+
+
+COLLECT_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=COLLECT_MEDIA_ROOT)
+class CollectMediaTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(COLLECT_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        shutil.rmtree(COLLECT_MEDIA_ROOT, ignore_errors=True)
+        self.kept = Post.objects.create(
+            author=self.author,
+            text='Пост с картинкой',
+            image=ContentFile(self.image_bytes('blue'), name='kept.png'),
+        )
+        self.make_old(self.kept.image.path)
+        self.orphan = self.write('posts/ab/orphan.png', old=True)
+        self.fresh = self.write('posts/cd/fresh.png', old=False)
+        MediaFile.objects.create(name='posts/ab/orphan.png', refs=0)
+
+    @staticmethod
+    def image_bytes(color):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    @staticmethod
+    def make_old(path):
+        day_ago = time.time() - 25 * 60 * 60
+        os.utime(path, (day_ago, day_ago))
+
+    def write(self, name, old):
+        path = os.path.join(COLLECT_MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(self.image_bytes('red'))
+        if old:
+            self.make_old(path)
+        return path
+
+    def thumbnail_files(self):
+        directory = os.path.join(COLLECT_MEDIA_ROOT, 'cache')
+        return [name for _, _, names in os.walk(directory) for name in names]
+
+    def test_orphans_go_to_quarantine_with_thumbnails(self):
+        '''Картинка без ссылок уходит в карантин, её миниатюры удаляются.'''
+        thumbnails.generate_image('posts/ab/orphan.png')
+        self.assertTrue(self.thumbnail_files())
+        output = StringIO()
+        call_command('collect_media', batch_size=1, stdout=output)
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(
+                    COLLECT_MEDIA_ROOT, 'quarantine', 'posts/ab/orphan.png'
+                )
+            )
+        )
+        self.assertTrue(os.path.exists(self.kept.image.path))
+        self.assertTrue(os.path.exists(self.fresh))
+        self.assertEqual(self.thumbnail_files(), [])
+        geometry, options = settings.POST_THUMBNAILS['card']
+        self.assertIsNone(
+            thumbnails.backend.lookup(
+                'posts/ab/orphan.png', geometry, **options
+            )
+        )
+        self.assertFalse(
+            MediaFile.objects.filter(name='posts/ab/orphan.png').exists()
+        )
+        self.assertIn('в карантине: 1', output.getvalue())
+
+    def test_files_referenced_after_listing_are_kept(self):
+        '''Файл, на который сослались после листинга, остаётся на месте.'''
+        MediaFile.objects.filter(name='posts/ab/orphan.png').update(refs=1)
+        listed = ['posts/ab/orphan.png', self.kept.image.name]
+        with mock.patch.object(
+            collect_media, 'unreferenced', lambda *streams: iter(listed)
+        ):
+            call_command('collect_media', stdout=StringIO())
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.kept.image.path))
+        self.assertTrue(
+            MediaFile.objects.filter(name='posts/ab/orphan.png').exists()
+        )
+
+    def test_identical_upload_refreshes_mtime(self):
+        '''Повторная загрузка того же файла молодит его для сборщика.'''
+        name = Post._meta.get_field('image').storage.save(
+            'posts/copy.png', ContentFile(self.image_bytes('blue'))
+        )
+        self.assertEqual(name, self.kept.image.name)
+        self.kept.delete()
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(os.path.exists(os.path.join(COLLECT_MEDIA_ROOT, name)))
+
+    def test_dry_run_and_delete(self):
+        '''--dry-run ничего не трогает, --delete удаляет без карантина.'''
+        call_command('collect_media', dry_run=True, stdout=StringIO())
+        self.assertTrue(os.path.exists(self.orphan))
+        call_command('collect_media', delete=True, stdout=StringIO())
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertFalse(
+            os.path.exists(os.path.join(COLLECT_MEDIA_ROOT, 'quarantine'))
+        )
+        self.assertTrue(os.path.exists(self.kept.image.path))
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import AuthorStats, Comment, Follow, Group, MediaFile, Post
 
 User = get_user_model()
 
@@ -64,3 +67,112 @@ class PostModelTest(TestCase):
                     PostModelTest.post._meta.get_field(value).help_text,
                     expected,
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, expected):
+        for obj, field, value in expected:
+            obj.refresh_from_db()
+            with self.subTest(obj=obj, field=field):
+                self.assertEqual(getattr(obj, field), value)
+
+    def test_post_and_comment_counters(self):
+        '''Счётчики постов и комментариев следуют за записями.'''
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        stats = self.author.stats
+        self.assertCounters(
+            (
+                (stats, 'posts_count', 1),
+                (self.group, 'posts_count', 1),
+                (post, 'comments_count', 1),
+            )
+        )
+        post.group = self.other_group
+        post.save()
+        self.assertCounters(
+            (
+                (self.group, 'posts_count', 0),
+                (self.other_group, 'posts_count', 1),
+            )
+        )
+        post.delete()
+        self.assertCounters(
+            (
+                (stats, 'posts_count', 0),
+                (self.other_group, 'posts_count', 0),
+            )
+        )
+
+    def test_follow_counters(self):
+        '''Счётчики подписок и подписчиков следуют за Follow.'''
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(
+            (
+                (self.author.stats, 'followers_count', 1),
+                (self.reader.stats, 'following_count', 1),
+            )
+        )
+        follow.delete()
+        self.assertCounters(
+            (
+                (self.author.stats, 'followers_count', 0),
+                (self.reader.stats, 'following_count', 0),
+            )
+        )
+
+    def test_media_file_refs(self):
+        '''Счётчик ссылок на файл картинки следует за постами.'''
+        shared = 'posts/ab/shared.webp'
+        first = Post.objects.create(
+            author=self.author, text='Пост', image=shared
+        )
+        second = Post.objects.create(
+            author=self.reader, text='Репост', image=shared
+        )
+        self.assertEqual(MediaFile.objects.get(name=shared).refs, 2)
+        second.image = 'posts/cd/other.webp'
+        second.save()
+        first.delete()
+        self.assertEqual(MediaFile.objects.get(name=shared).refs, 0)
+        self.assertEqual(MediaFile.objects.get(name=second.image).refs, 1)
+
+    def test_recount_command_repairs_drift(self):
+        '''Команда recount_counters чинит разъехавшиеся счётчики.'''
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(posts_count=42, followers_count=7)
+        Group.objects.update(posts_count=0)
+        Post.objects.update(comments_count=3, image='posts/ab/lost.webp')
+        call_command('recount_counters', chunk_size=1, stdout=StringIO())
+        lost = MediaFile.objects.get(name='posts/ab/lost.webp')
+        self.assertEqual(lost.refs, 1)
+        self.assertCounters(
+            (
+                (self.author.stats, 'posts_count', 1),
+                (self.author.stats, 'followers_count', 1),
+                (self.reader.stats, 'following_count', 1),
+                (self.group, 'posts_count', 1),
+                (post, 'comments_count', 0),
+            )
+        )
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class QueryPlanTest(TestCase):
+    '''Запросы за страницами ленты идут по индексам.
+
+    Для каждого SELECT, выполненного view, смотрим ``EXPLAIN QUERY PLAN``:
+    полный проход по таблице (``SCAN`` без индекса) и сортировка во
+    временном B-дереве (``USE TEMP B-TREE``) означают, что страница
+    дорожает с ростом таблицы.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.reader = User.objects.create_user(username='Женя')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, text='Пост для пайджинга', group=cls.group)
+            for _ in range(settings.NUM_POSTS)
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Тестовый пост', group=cls.group
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedPlan(self, sql):
+        plan = self.explain(sql)
+        for step in plan:
+            with self.subTest(sql=sql, step=step):
+                self.assertNotIn('TEMP B-TREE', step)
+                if step.startswith('SCAN'):
+                    self.assertIn('USING', step)
+        return plan
+
+    def test_feed_queries_use_indexes(self):
+        '''Ни одна лента не сканирует таблицу и не сортирует в памяти.
+
+        Кеш чистится перед каждым запросом: иначе страницу отдал бы кеш
+        и запросы ленты и счётчика не попали бы под EXPLAIN.
+        '''
+        first_page = self.authorized_client.get(reverse('posts:index'))
+        next_cursor = first_page.context['page_obj'].next_cursor
+        cases = (
+            (reverse('posts:index'), 'post_date_idx'),
+            (reverse('posts:index') + f'?cursor={next_cursor}',
+             'post_date_idx'),
+            (reverse('posts:index') + '?page=2', 'post_date_idx'),
+            (reverse('posts:group_list', args=[self.group.slug]),
+             'post_group_date_idx'),
+            (reverse('posts:profile', args=[self.author.username]),
+             'post_author_date_idx'),
+            (reverse('posts:post_detail', args=[self.post.pk]),
+             'comment_post_created_idx'),
+            (reverse('posts:post_comments', args=[self.post.pk]),
+             'comment_post_created_idx'),
+            (reverse('posts:follow_index'), 'timeline_user_date_idx'),
+        )
+        for url, index in cases:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.authorized_client.get(url)
+            steps = []
+            for query in queries:
+                if query['sql'].startswith('SELECT'):
+                    steps.extend(self.assertIndexedPlan(query['sql']))
+            with self.subTest(url=url):
+                self.assertTrue(
+                    any(f'INDEX {index}' in step for step in steps),
+                    f'{index} не используется: {steps}',
+                )
@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -34,6 +35,8 @@ class PostUrlTest(TestCase):
 
     def setUp(self):
         '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        # страницы кешируются целиком — каждый тест рендерит их заново
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -1,15 +1,38 @@
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 
 
-from ..models import Follow, Group, Post
+from ..models import Comment, Follow, Group, Post, TimelineEntry
 from ..forms import PostForm
+from ..paginators import CachedCountPaginator, CursorPaginator
+
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.conf import settings
 
+from core.cache import get_or_rebuild, lock_key
+from .. import thumbnails
+from .. import timeline
+from ..timeline import FollowTimeline
+from ..templatetags import post_cards
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
 User = get_user_model()
 
 
@@ -60,6 +83,8 @@ class PostViewTest(TestCase):
 
     def setUp(self):
         '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        # страницы кешируются целиком — каждый тест рендерит их заново
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -142,23 +167,44 @@ class PostViewTest(TestCase):
         self.assertNotIn(self.post, response.context['page_obj'])
 
     def test_index_cache(self):
-        '''Проверка работы кеша на странице index'''
+        '''Фрагмент index кешируется и сбрасывается записью поста.'''
         post_for_del = Post.objects.create(
             text='Пост для удаления', author=self.user
         )
-        check_index_before_del = self.authorized_client.get(
+        check_index_before_update = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        post_for_del.delete()
-        check_index_after_del = self.authorized_client.get(
+        # UPDATE мимо сигналов не меняет версию ленты — отдаётся кеш
+        Post.objects.filter(pk=post_for_del.pk).update(text='Изменённый')
+        check_index_after_update = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        self.assertEqual(check_index_before_del, check_index_after_del)
-        cache.clear()
-        check_index_after_clear = self.authorized_client.get(
+        self.assertEqual(check_index_before_update, check_index_after_update)
+        post_for_del.delete()
+        check_index_after_del = self.authorized_client.get(
             reverse('posts:index')
         ).content
-        self.assertNotEqual(check_index_before_del, check_index_after_clear)
+        self.assertNotEqual(check_index_before_update, check_index_after_del)
+        self.assertNotIn('Изменённый'.encode(), check_index_after_del)
+
+    def test_feed_fragments_follow_writes(self):
+        '''Новый пост сразу виден во всех лентах с кешем фрагментов.'''
+        self.authorized_client.force_login(self.new_user)
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+        )
+        for address in addresses:
+            self.authorized_client.get(address)
+        Post.objects.create(
+            text='Свежий пост', author=self.user, group=self.group
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.authorized_client.get(address)
+                self.assertContains(response, 'Свежий пост')
 
     def test_follow(self):
         '''Проверка подписки.'''
@@ -237,6 +283,7 @@ class Paginator(TestCase):
 
     def setUp(self):
         '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
         self.guest_client = Client()
 
     def test_first_page_contains_ten_records(self):
@@ -268,3 +315,1035 @@ class Paginator(TestCase):
                 response = self.client.get(address)
                 count_post = len(response.context.get('page_obj'))
                 self.assertEqual(count_post, self.POSTS_ON_LAST_PAGE)
+
+
+class CursorPaginatorTest(TestCase):
+    TOTAL_POSTS_COUNT = 25
+
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Mokrushin')
+        Post.objects.bulk_create(
+            [
+                Post(author=cls.user, text=f'Пост {number}')
+                for number in range(cls.TOTAL_POSTS_COUNT)
+            ]
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_cursor_walks_whole_feed(self):
+        '''Проход по курсорам отдаёт все посты без повторов и по порядку.'''
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        response = self.guest_client.get(reverse('posts:index'))
+        page_obj = response.context['page_obj']
+        seen = [post.pk for post in page_obj]
+        while page_obj.next_cursor:
+            response = self.guest_client.get(
+                reverse('posts:index'), {'cursor': page_obj.next_cursor}
+            )
+            page_obj = response.context['page_obj']
+            self.assertIsNone(page_obj.number)
+            seen.extend(post.pk for post in page_obj)
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        '''Курсор назад возвращает предыдущую страницу.'''
+        first_page = self.guest_client.get(reverse('posts:index')).context[
+            'page_obj'
+        ]
+        second_page = self.guest_client.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        back_page = self.guest_client.get(
+            reverse('posts:index'), {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertFalse(back_page.has_previous())
+
+    def test_cursor_page_does_not_count(self):
+        '''Страница по курсору не делает COUNT(*) и OFFSET.'''
+        first_page = self.guest_client.get(reverse('posts:index')).context[
+            'page_obj'
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(
+                reverse('posts:index'), {'cursor': first_page.next_cursor}
+            )
+        for query in queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('COUNT(', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+
+    def test_broken_cursor_returns_first_page(self):
+        '''Испорченный курсор отдаёт первую страницу.'''
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'не-курсор'}
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), settings.NUM_POSTS
+        )
+
+    def test_null_cursor_is_rejected(self):
+        '''Курсор с пустыми значениями ключа не роняет ленты.'''
+        cursor = CursorPaginator(Post.objects.all(), 1).encode_cursor(
+            Post(pub_date=None, pk=None)
+        )
+        for address in (
+            reverse('posts:index'),
+            reverse('posts:index_more'),
+            reverse('posts:api_index'),
+        ):
+            with self.subTest(address=address):
+                response = self.guest_client.get(address, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+
+    def test_cursor_pages_render_their_own_posts(self):
+        '''Кеш ленты различает страницы по курсору.'''
+        def link(pk):
+            return f'href="{reverse("posts:post_detail", args=(pk,))}"'
+
+        response = self.guest_client.get(reverse('posts:index'))
+        shown = []
+        while True:
+            page_obj = response.context['page_obj']
+            content = response.content.decode()
+            for post in page_obj:
+                self.assertIn(link(post.pk), content)
+            for pk in shown:
+                self.assertNotIn(link(pk), content)
+            shown.extend(post.pk for post in page_obj)
+            if not page_obj.next_cursor:
+                break
+            response = self.guest_client.get(
+                reverse('posts:index'), {'cursor': page_obj.next_cursor}
+            )
+        self.assertEqual(len(shown), self.TOTAL_POSTS_COUNT)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.reader = User.objects.create_user(username='Женя')
+        cls.old_post = Post.objects.create(
+            author=cls.author, text='Пост до подписки'
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_new_post_is_pushed_to_followers(self):
+        '''Новый пост автора попадает в ленту подписчика.'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        '''Подписка докладывает старые посты, отписка их убирает.'''
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.reader, post=self.old_post
+            ).exists()
+        )
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists()
+        )
+
+    def test_follow_index_reads_only_timeline(self):
+        '''Посты ленты читаются из таблицы ленты без соединения с Follow.'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertIn(self.old_post, response.context['page_obj'])
+        for query in queries:
+            with self.subTest(sql=query['sql']):
+                self.assertFalse(
+                    'posts_follow' in query['sql']
+                    and 'posts_post' in query['sql']
+                )
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=1)
+    def test_celebrity_posts_are_pulled_and_merged(self):
+        '''Посты «знаменитости» не раздаются, а сливаются при чтении.'''
+        celebrity = User.objects.create_user(username='Звезда')
+        fan = User.objects.create_user(username='Фанат')
+        Follow.objects.create(user=fan, author=celebrity)
+        Follow.objects.create(user=self.reader, author=celebrity)
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = []
+        for number in range(settings.NUM_POSTS + 3):
+            author = celebrity if number % 2 else self.author
+            posts.append(
+                Post.objects.create(author=author, text=f'Пост {number}')
+            )
+        self.assertFalse(
+            TimelineEntry.objects.filter(post__author=celebrity).exists()
+        )
+        expected = [post.pk for post in reversed(posts)] + [self.old_post.pk]
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        seen = [post.pk for post in page_obj]
+        response = self.reader_client.get(
+            reverse('posts:follow_index'), {'cursor': page_obj.next_cursor}
+        )
+        seen.extend(post.pk for post in response.context['page_obj'])
+        self.assertEqual(seen, expected)
+        self.assertEqual(page_obj.paginator.count, len(expected))
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=1)
+    def test_demoted_celebrity_posts_stay_in_timeline(self):
+        '''Посты времён «знаменитости» не пропадают после отписки фанатов.'''
+        celebrity = User.objects.create_user(username='Звезда')
+        fan = User.objects.create_user(username='Фанат')
+        Follow.objects.create(user=self.reader, author=celebrity)
+        Follow.objects.create(user=fan, author=celebrity)
+        post = Post.objects.create(author=celebrity, text='Звёздный пост')
+        self.assertIn(post, FollowTimeline(self.reader)[:settings.NUM_POSTS])
+        callbacks = []
+        with mock.patch.object(
+            timeline.transaction, 'on_commit', callbacks.append
+        ):
+            Follow.objects.filter(user=fan).delete()
+        # в запросе только постановка в очередь
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(len(callbacks), 1)
+        with override_settings(TIMELINE_WORKERS=0):
+            callbacks[0]()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    @override_settings(TIMELINE_MAX_PAGES=2)
+    def test_numbered_pages_are_capped(self):
+        '''Номерные страницы ленты подписок не глубже TIMELINE_MAX_PAGES,
+        дальше лента листается по курсору.
+        '''
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(settings.NUM_POSTS * 3):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        with mock.patch.object(
+            FollowTimeline, '__getitem__', autospec=True,
+            side_effect=FollowTimeline.__getitem__,
+        ) as getitem:
+            response = self.reader_client.get(
+                reverse('posts:follow_index'), {'page': 1000}
+            )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertEqual(page_obj.paginator.num_pages, 2)
+        for call in getitem.call_args_list:
+            self.assertLessEqual(call[0][1].stop, settings.NUM_POSTS * 2)
+        self.assertIsNotNone(page_obj.next_cursor)
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+        self.assertNotContains(response, '?page=3')
+
+    def test_cached_fragment_skips_timeline_read(self):
+        '''Из кеша фрагментов лента и ссылки дальше отдаются без чтения
+        постов: курсор следующей страницы считается при сборке фрагмента.
+        '''
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(settings.NUM_POSTS + 1):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        url = reverse('posts:follow_index')
+        first = self.reader_client.get(url)
+        with mock.patch.object(FollowTimeline, 'keyset_slice') as read:
+            second = self.reader_client.get(url)
+        read.assert_not_called()
+        next_cursor = first.context['page_obj'].next_cursor
+        self.assertContains(second, f'?cursor={next_cursor}', 2)
+
+    def test_count_follows_deleted_posts(self):
+        '''Удалённый пост автора подписки сразу уходит из числа постов.'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(FollowTimeline(self.reader).count(), 2)
+        post.delete()
+        self.assertEqual(FollowTimeline(self.reader).count(), 1)
+
+    @override_settings(TIMELINE_CELEBRITY_THRESHOLD=1)
+    def test_count_is_cached_per_branch(self):
+        '''Число постов inbox и inbox без «знаменитостей» не путаются.'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(FollowTimeline(self.reader).count(), 1)
+        fan = User.objects.create_user(username='Фанат')
+        Follow.objects.create(user=fan, author=self.author)
+        self.assertEqual(FollowTimeline(self.reader).count(), 1)
+
+
+class FeedCountCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Mokrushin')
+        Post.objects.bulk_create(
+            Post(author=cls.user, text='Пост для пайджинга')
+            for _ in range(settings.NUM_POSTS + 1)
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        self.guest_client = Client()
+        cache.clear()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        return response, [q for q in queries if 'COUNT(' in q['sql']]
+
+    def test_count_is_cached_and_reset_on_write(self):
+        '''Число постов ленты кешируется и сбрасывается новым постом.'''
+        url = reverse('posts:profile', args=[self.user.username])
+        _, counts = self.count_queries(url)
+        self.assertEqual(len(counts), 1)
+        _, counts = self.count_queries(url)
+        self.assertEqual(counts, [])
+        Post.objects.create(author=self.user, text='Новый пост')
+        response, counts = self.count_queries(url)
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            settings.NUM_POSTS + 2,
+        )
+
+    def test_page_window(self):
+        '''Навигация показывает окно страниц, а не все страницы.'''
+        paginator = CachedCountPaginator(range(100), 1)
+        cases = (
+            (1, [1, 2, 3, None, 100]),
+            (4, [1, 2, 3, 4, 5, 6, None, 100]),
+            (50, [1, None, 48, 49, 50, 51, 52, None, 100]),
+            (100, [1, None, 98, 99, 100]),
+        )
+        for number, expected in cases:
+            with self.subTest(number=number):
+                self.assertEqual(paginator.page_window(number), expected)
+
+
+class SingleFlightCacheTest(TestCase):
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.builds = []
+
+    def build(self):
+        self.builds.append(len(self.builds) + 1)
+        return self.builds[-1]
+
+    def test_fresh_value_is_not_rebuilt(self):
+        '''Свежее значение отдаётся из кеша без пересборки.'''
+        get_or_rebuild('key', self.build, 600, version=1)
+        self.assertEqual(get_or_rebuild('key', self.build, 600, version=1), 1)
+        self.assertEqual(self.builds, [1])
+
+    def test_stale_value_served_while_other_worker_rebuilds(self):
+        '''Пока один воркер пересобирает, остальные получают старое.'''
+        get_or_rebuild('key', self.build, 600, version=1)
+        cache.add(lock_key('key'), True)
+        self.assertEqual(get_or_rebuild('key', self.build, 600, version=2), 1)
+        self.assertEqual(self.builds, [1])
+        cache.delete(lock_key('key'))
+        self.assertEqual(get_or_rebuild('key', self.build, 600, version=2), 2)
+
+    def test_stale_value_is_not_served_on_request(self):
+        '''С serve_stale=False старое значение пересобирается и под
+        чужой блокировкой, а блокировка остаётся чужой.
+        '''
+        get_or_rebuild('key', self.build, 600, version=1)
+        cache.add(lock_key('key'), True)
+        self.assertEqual(
+            get_or_rebuild('key', self.build, 600, 2, serve_stale=False), 2
+        )
+        self.assertTrue(cache.get(lock_key('key')))
+
+    def test_expired_value_is_rebuilt(self):
+        '''Истёкшее значение пересобирается и блокировка снимается.'''
+        get_or_rebuild('key', self.build, 0, version=1)
+        self.assertEqual(get_or_rebuild('key', self.build, 600, version=1), 2)
+        self.assertIsNone(cache.get(lock_key('key')))
+
+
+class SharedPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.reader = User.objects.create_user(username='Женя')
+        cls.post = Post.objects.create(author=cls.author, text='Общий пост')
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_guest_page_is_served_from_cache(self):
+        '''Повторный запрос гостя не рендерит шаблоны.'''
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        first = self.guest_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.guest_client.get(url)
+        self.assertIsNone(second.context)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(queries), 1)
+
+    def test_users_share_body_with_own_holes(self):
+        '''Авторизованные получают общую страницу со своими фрагментами.'''
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        edit_url = reverse('posts:post_edit', args=[self.post.pk])
+        self.author_client.get(url)
+        response = self.reader_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, 'Пользователь: Женя')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, edit_url)
+        response = self.author_client.get(url)
+        self.assertContains(response, 'Пользователь: Mokrushin')
+        self.assertContains(response, edit_url)
+
+    def test_write_invalidates_shared_page(self):
+        '''Новый комментарий сразу виден на закешированной странице.'''
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.guest_client.get(url)
+        self.reader_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Свежий комментарий'},
+        )
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий')
+
+    def test_shared_page_does_not_keep_stale_fragment(self):
+        '''Общая страница не сохраняет фрагмент, который в этот момент
+        пересобирает другой воркер.
+        '''
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.create(author=self.author, text='Новый пост')
+        fragment = make_template_fragment_key('index_feed', [1, ''])
+        cache.add(lock_key(fragment), True)
+        response = self.guest_client.get(reverse('posts:index'), {'page': 1})
+        self.assertContains(response, 'Новый пост')
+        cache.delete(lock_key(fragment))
+        response = self.guest_client.get(reverse('posts:index'), {'page': 1})
+        self.assertContains(response, 'Новый пост')
+
+    def test_group_rename_refreshes_cached_pages(self):
+        '''Новые название и slug группы видны на закешированных страницах.'''
+        group = Group.objects.create(
+            title='Старое название', slug='old-slug', description='Группа'
+        )
+        post = Post.objects.create(
+            author=self.author, group=group, text='Пост в группе'
+        )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[post.pk]),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        group.title = 'Новое название'
+        group.slug = 'new-slug'
+        group.save()
+        new_link = reverse('posts:group_list', args=['new-slug'])
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, new_link)
+                self.assertNotContains(response, 'old-slug')
+        self.assertContains(response, 'Новое название')
+
+    def test_follow_button_is_per_user(self):
+        '''Кнопка подписки в профиле своя у каждого пользователя.'''
+        url = reverse('posts:profile', args=[self.author.username])
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertContains(self.reader_client.get(url), 'Отписаться')
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Отписаться')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.reader = User.objects.create_user(username='Женя')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост с валидаторами'
+        )
+        cls.urls = (
+            reverse('posts:post_detail', args=[cls.post.pk]),
+            reverse('posts:profile', args=[cls.author.username]),
+            reverse('posts:group_list', args=[cls.group.slug]),
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_matching_etag_returns_304_without_render(self):
+        '''Совпавший ETag даёт 304 без рендера и запросов ленты.'''
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+                self.assertLessEqual(len(queries), 1)
+
+    def test_if_modified_since_returns_304(self):
+        '''Не изменившаяся с Last-Modified страница отдаёт 304.'''
+        url = self.urls[0]
+        modified = self.guest_client.get(url)['Last-Modified']
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_etag(self):
+        '''Новый комментарий меняет ETag страницы поста.'''
+        url = self.urls[0]
+        etag = self.guest_client.get(url)['ETag']
+        self.reader_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Свежий комментарий'},
+        )
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_stale_page_keeps_own_validators(self):
+        '''Страница прежней версии из кеша отдаётся со своим ETag.'''
+        url = reverse('posts:index')
+        first = self.guest_client.get(url)
+        Post.objects.create(author=self.author, text='Новый пост')
+        digest = hashlib.md5(url.encode()).hexdigest()
+        cache.add(lock_key(f'page:posts.views.index:{digest}:guest'), True)
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, 'Новый пост')
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response['Last-Modified'], first['Last-Modified'])
+        cache.delete(lock_key(f'page:posts.views.index:{digest}:guest'))
+        response = self.guest_client.get(url)
+        self.assertContains(response, 'Новый пост')
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_etag_differs_per_user(self):
+        '''Чужой ETag не подходит: фрагменты у каждого свои.'''
+        url = self.urls[1]
+        etag = self.guest_client.get(url)['ETag']
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+@override_settings(THUMBNAIL_WORKERS=0, MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def upload(self, name):
+        # разные картинки: одинаковые хранятся одним файлом
+        buffer = BytesIO()
+        color = tuple(hashlib.md5(name.encode()).digest()[:3])
+        Image.new('RGB', (2, 1), color).save(buffer, 'GIF')
+        return SimpleUploadedFile(
+            name=name, content=buffer.getvalue(), content_type='image/gif'
+        )
+
+    def test_page_shows_placeholder_until_thumbnail_is_ready(self):
+        '''Страница не режет картинку сама, а ждёт фоновую нарезку.'''
+        post = Post.objects.create(
+            author=self.author, text='Пост', image=self.upload('wait.gif')
+        )
+        url = reverse('posts:post_detail', args=[post.pk])
+        self.assertIsNone(thumbnails.lookup(post.image))
+        response = self.author_client.get(url)
+        self.assertContains(response, 'aspect-ratio')
+        self.assertNotContains(response, '<img class="card-img')
+        thumbnails.generate(post.pk)
+        thumbnail = thumbnails.lookup(post.image)
+        self.assertIsNotNone(thumbnail)
+        response = self.author_client.get(url)
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, 'aspect-ratio')
+
+    def test_create_schedules_thumbnails_after_commit(self):
+        '''Создание поста с картинкой ставит нарезку в очередь.'''
+        with mock.patch.object(
+            thumbnails.transaction, 'on_commit', lambda callback: callback()
+        ):
+            self.author_client.post(
+                reverse('posts:post_create'),
+                {'text': 'С картинкой', 'image': self.upload('new.gif')},
+            )
+        post = Post.objects.get(text='С картинкой')
+        self.assertIsNotNone(thumbnails.lookup(post.image))
+
+    def test_feed_page_reads_thumbnails_in_one_query(self):
+        '''Миниатюры страницы ленты читаются одним запросом.'''
+        posts = [
+            Post.objects.create(
+                author=self.author,
+                text=f'Пост {number}',
+                image=self.upload(f'feed{number}.gif'),
+            )
+            for number in range(3)
+        ]
+        for post in posts[1:]:
+            thumbnails.generate(post.pk)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.author_client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertContains(response, '<img class="card-img', count=2)
+        self.assertContains(response, 'aspect-ratio', count=1)
+
+    def test_image_has_srcset_of_all_sizes(self):
+        '''Картинка поста отдаётся набором размеров через srcset.'''
+        post = Post.objects.create(
+            author=self.author, text='Пост', image=self.upload('sizes.gif')
+        )
+        thumbnails.generate(post.pk)
+        response = self.author_client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        for variant in settings.POST_IMAGE_SRCSET:
+            thumbnail = thumbnails.lookup(post.image, variant)
+            with self.subTest(variant=variant):
+                self.assertContains(
+                    response, f'{thumbnail.url} {thumbnail.width}w'
+                )
+        self.assertContains(response, 'sizes="(min-width: 768px) 75vw')
+
+    def test_regenerate_command_resumes_from_checkpoint(self):
+        '''Команда нарезает все картинки и продолжает с отметки.'''
+        posts = [
+            Post.objects.create(
+                author=self.author,
+                text=f'Пост {number}',
+                image=self.upload(f'bulk{number}.gif'),
+            )
+            for number in range(3)
+        ]
+        Post.objects.create(author=self.author, text='Без картинки')
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'checkpoint')
+            call_command(
+                'regenerate_thumbnails',
+                processes=0,
+                chunk_size=2,
+                checkpoint=checkpoint,
+                stdout=StringIO(),
+            )
+            for post in posts:
+                with self.subTest(post=post.text):
+                    self.assertIsNotNone(thumbnails.lookup(post.image))
+            with open(checkpoint) as saved:
+                self.assertEqual(saved.read(), str(posts[-1].pk))
+            output = StringIO()
+            call_command(
+                'regenerate_thumbnails',
+                processes=0,
+                checkpoint=checkpoint,
+                stdout=output,
+            )
+        self.assertIn('Готово: 0', output.getvalue())
+
+
+@override_settings(THUMBNAIL_WORKERS=1, MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPoolTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+
+    def test_pool_generates_thumbnails_after_commit(self):
+        '''Фоновый пул нарезает миниатюры закоммиченного поста.'''
+        post = Post.objects.create(
+            author=User.objects.create_user(username='Mokrushin'),
+            text='Пост',
+            image=SimpleUploadedFile(
+                name='pool.gif', content=SMALL_GIF, content_type='image/gif'
+            ),
+        )
+        callbacks = []
+        with mock.patch.object(
+            thumbnails.transaction, 'on_commit', callbacks.append
+        ):
+            thumbnails.schedule(post)
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(thumbnails.lookup(post.image))
+        future = callbacks[0]()
+        future.result(timeout=10)
+        self.assertIsNotNone(thumbnails.lookup(post.image))
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='Mokrushin', is_staff=True, is_superuser=True
+        )
+        cls.best = Post.objects.create(
+            author=cls.author, text='Кот, кот и ещё раз КОТ'
+        )
+        cls.other = Post.objects.create(
+            author=cls.author, text='Котики спят на диване'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Про кота {number}')
+            for number in range(settings.NUM_POSTS + 3)
+        )
+        Post.objects.create(author=cls.author, text='Про собаку')
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response.context['page_obj']
+
+    def test_results_are_ranked_and_paginated_by_cursor(self):
+        '''Лучшее совпадение первым, курсоры проходят всю выдачу.'''
+        page_obj = self.search('кот')
+        self.assertEqual(page_obj[0], self.best)
+        seen = [post.pk for post in page_obj]
+        while page_obj.next_cursor:
+            page_obj = self.search('кот', cursor=page_obj.next_cursor)
+            seen.extend(post.pk for post in page_obj)
+        expected = Post.objects.exclude(text='Про собаку')
+        self.assertEqual(len(seen), expected.count())
+        self.assertEqual(set(seen), set(expected.values_list('pk', flat=True)))
+
+    def test_pagination_links_keep_query(self):
+        '''Ссылки на соседние страницы сохраняют поисковый запрос.'''
+        response = self.guest_client.get(reverse('posts:search'), {'q': 'кот'})
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%82&amp;cursor=')
+        self.assertContains(response, next_cursor)
+
+    def test_index_follows_writes(self):
+        '''Правки и удаления, в том числе массовые, попадают в индекс.'''
+        Post.objects.filter(pk=self.other.pk).update(text='Мыши в подвале')
+        self.assertNotIn(self.other, list(self.search('котики')))
+        self.assertIn(self.other, list(self.search('подвал')))
+        Post.objects.filter(pk=self.best.pk).delete()
+        found = [post.pk for post in self.search('кот')]
+        self.assertNotIn(self.best.pk, found)
+
+    def test_query_syntax_is_not_interpreted(self):
+        '''Операторы FTS5 во вводе не ломают поиск.'''
+        for query in ('"', 'кот OR', 'NEAR(кот', '-кот', '*', ''):
+            with self.subTest(query=query):
+                response = self.guest_client.get(
+                    reverse('posts:search'), {'q': query}
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_admin_search_uses_index(self):
+        '''Поиск в админке идёт по индексу, а не LIKE по всем постам.'''
+        self.guest_client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'собаку'}
+            )
+        self.assertEqual(response.context['cl'].result_count, 1)
+        for query in queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('LIKE', query['sql'])
+
+
+@override_settings(NUM_COMMENTS=3)
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {number}'
+            )
+            for number in range(7)
+        ]
+        cls.url = reverse('posts:post_comments', args=[cls.post.pk])
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_first_page_is_inline(self):
+        '''На странице поста только первая страница комментариев.'''
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assertEqual(
+            list(response.context['comments']), self.comments[:3]
+        )
+        self.assertContains(response, 'comments-more')
+        self.assertNotContains(response, 'Комментарий 3')
+
+    def test_fragments_load_remaining_comments(self):
+        '''Фрагменты по курсору отдают остальные комментарии по порядку.'''
+        cursor = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        ).context['comments'].next_cursor
+        seen = []
+        while cursor:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.guest_client.get(self.url, {'cursor': cursor})
+            for query in queries:
+                with self.subTest(sql=query['sql']):
+                    self.assertNotIn('COUNT(', query['sql'])
+                    self.assertNotIn('OFFSET', query['sql'])
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            self.assertTemplateNotUsed(response, 'base.html')
+            page = response.context['comments']
+            seen.extend(page)
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.comments[3:])
+
+    def test_json_page(self):
+        '''В JSON — комментарии страницы и курсор на следующую.'''
+        data = self.guest_client.get(self.url, {'format': 'json'}).json()
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'],
+        )
+        self.assertEqual(data['comments'][0]['author'], 'Mokrushin')
+        data = self.guest_client.get(
+            self.url, {'format': 'json', 'cursor': data['next_cursor']}
+        ).json()
+        self.assertEqual(data['comments'][0]['id'], self.comments[3].pk)
+
+    def test_new_comment_changes_etag(self):
+        '''Фрагмент отвечает 304, пока у поста не появился комментарий.'''
+        etag = self.guest_client.get(self.url)['ETag']
+        response = self.guest_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Новый'
+        )
+        response = self.guest_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post(self):
+        '''У несуществующего поста нет и комментариев.'''
+        response = self.guest_client.get(
+            reverse('posts:post_comments', args=[self.post.pk + 100])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class FeedFragmentTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.reader = User.objects.create_user(username='Женя')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Пост {number}', group=cls.group)
+            for number in range(2 * settings.NUM_POSTS + 3)
+        )
+        for post in Post.objects.all():
+            TimelineEntry.objects.create(
+                user=cls.reader, post=post, pub_date=post.pub_date
+            )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_fragments_walk_feeds_by_header_cursor(self):
+        '''Фрагменты по X-Next-Cursor проходят ленту после первой страницы.'''
+        expected = list(
+            Post.objects.order_by('-pub_date', '-pk').values_list(
+                'pk', flat=True
+            )
+        )
+        feeds = (
+            ('posts:index', 'posts:index_more', []),
+            ('posts:group_list', 'posts:group_more', [self.group.slug]),
+            ('posts:profile', 'posts:profile_more', [self.author.username]),
+            ('posts:follow_index', 'posts:follow_more', []),
+        )
+        for page_name, more_name, args in feeds:
+            with self.subTest(feed=page_name):
+                page_obj = self.reader_client.get(
+                    reverse(page_name, args=args)
+                ).context['page_obj']
+                seen = [post.pk for post in page_obj]
+                cursor = page_obj.next_cursor
+                while cursor:
+                    response = self.reader_client.get(
+                        reverse(more_name, args=args), {'cursor': cursor}
+                    )
+                    self.assertTemplateNotUsed(response, 'base.html')
+                    page_obj = response.context['page_obj']
+                    seen.extend(post.pk for post in page_obj)
+                    cursor = response.get('X-Next-Cursor')
+                self.assertEqual(seen, expected)
+
+    def test_page_links_to_fragment(self):
+        '''Страница ленты ведёт кнопкой «Показать ещё» на фрагмент.'''
+        response = self.reader_client.get(
+            reverse('posts:group_list', args=[self.group.slug])
+        )
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(
+            response,
+            f'{reverse("posts:group_more", args=[self.group.slug])}'
+            f'?cursor={next_cursor}',
+        )
+        self.assertContains(response, 'class="pagination"', 1)
+
+    def test_fragment_revalidates_by_etag(self):
+        '''Фрагмент отвечает 304, пока лента не изменилась.'''
+        url = reverse('posts:index_more')
+        etag = self.reader_client.get(url)['ETag']
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class PostCardTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''Вызывается один раз перед запуском всех тестов класса.'''
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Mokrushin')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f'Пост {number}', group=cls.group)
+            for number in range(settings.NUM_POSTS)
+        )
+
+    def setUp(self):
+        '''Подготовка прогона теста. Вызывается перед каждым тестом.'''
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_urls_are_reversed_once(self):
+        '''Ссылки автора и группы считаются раз на страницу, поста — раз.'''
+        with mock.patch.object(
+            post_cards, 'reverse', wraps=post_cards.reverse
+        ) as reverse_mock:
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(reverse_mock.call_count, settings.NUM_POSTS + 2)
+        self.assertContains(
+            response,
+            f'<a href="{reverse("posts:profile", args=[self.author])}">',
+            count=settings.NUM_POSTS,
+        )
+        self.assertContains(
+            response,
+            f'<a href="{reverse("posts:group_list", args=[self.group.slug])}"'
+            '>все записи группы</a>',
+            count=settings.NUM_POSTS,
+        )
+        self.assertContains(response, '<hr>', count=settings.NUM_POSTS - 1)
+
+    def test_benchmark(self):
+        '''Замер рисует страницу обоими способами.'''
+        output = StringIO()
+        call_command('benchmark_post_cards', pages=1, stdout=output)
+        self.assertIn(
+            f'{settings.NUM_POSTS} карточек: include', output.getvalue()
+        )
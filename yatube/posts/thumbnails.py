@@ -0,0 +1,162 @@
+'''Миниатюры картинок постов, нарезанные заранее.
+
+Размеры объявлены в ``settings.POST_THUMBNAILS``. ``schedule`` после
+коммита отдаёт нарезку фоновому пулу, шаблоны через ``lookup`` только
+читают готовые миниатюры из key-value хранилища sorl и показывают
+заглушку, пока миниатюры нет. Для страницы ленты ``PageThumbnails``
+читает миниатюры всех постов одним multi-get.
+'''
+from django.conf import settings
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+
+from core import background
+
+from . import timeline
+from .caching import bump_feed_versions, post_feeds, post_page
+from .models import Post
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    '''Бэкенд sorl, который умеет искать миниатюру, не создавая её.'''
+
+    def lookup(self, file_, geometry_string, **options):
+        '''Готовая миниатюра или ``None``; исходник не открывается.'''
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options)
+        )
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        '''Файл миниатюры, каким его назовёт ``get_thumbnail``.'''
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self.full_options(source, options)
+        )
+        return ImageFile(name, default.storage)
+
+    def full_options(self, source, options):
+        # те же умолчания, что добавляет get_thumbnail: от них зависит
+        # имя файла миниатюры
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+
+backend = PostThumbnailBackend()
+
+
+def lookup(image, variant='card'):
+    '''Готовая миниатюра ``variant`` картинки или ``None``.'''
+    if not image:
+        return None
+    geometry, options = settings.POST_THUMBNAILS[variant]
+    return backend.lookup(image.name, geometry, **options)
+
+
+def lookup_many(images, variants):
+    '''Готовые миниатюры по ``(имя картинки, размер)``, одним multi-get.
+
+    Не нарезанных ещё миниатюр в ответе нет.
+    '''
+    names = {}
+    for image in images:
+        if not image:
+            continue
+        for variant in variants:
+            geometry, options = settings.POST_THUMBNAILS[variant]
+            thumbnail = backend.thumbnail_file(image.name, geometry, **options)
+            names[add_prefix(thumbnail.key)] = (image.name, variant)
+    values = _get_raw_many(list(names))
+    return {
+        names[key]: deserialize_image_file(value)
+        for key, value in values.items()
+    }
+
+
+def _get_raw_many(keys):
+    store = default.kvstore
+    if not isinstance(store, CachedDBStore):
+        values = {key: store._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    values = store.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing).values_list('key', 'value')
+        )
+        # как и sorl, запоминаем в кеше и отсутствие миниатюры
+        fresh = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        store.cache.set_many(
+            fresh, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fresh)
+    return {
+        key: value for key, value in values.items() if value != EMPTY_VALUE
+    }
+
+
+class PageThumbnails:
+    '''Миниатюры картинок постов страницы, прочитанные разом.
+
+    Все объявленные размеры читаются одним ``lookup_many`` при первом
+    обращении: если список постов взят из кеша фрагментов, запросов
+    не будет вовсе.
+    '''
+
+    def __init__(self, posts):
+        self.posts = posts
+        self.found = None
+
+    def get(self, image, variant='card'):
+        if self.found is None:
+            self.found = lookup_many(
+                (post.image for post in self.posts), settings.POST_THUMBNAILS
+            )
+        return self.found.get((image.name, variant))
+
+
+def generate(post_id):
+    '''Нарезает все объявленные миниатюры поста.
+
+    Закешированные страницы с заглушкой после этого пересобираются.
+    '''
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    generate_image(post.image.name)
+    bump_feed_versions(post_feeds(post) + [post_page(post.pk)])
+    timeline.touch_followers(post)
+
+
+def generate_image(name):
+    '''Нарезает все объявленные миниатюры картинки по имени в хранилище.'''
+    for geometry, options in settings.POST_THUMBNAILS.values():
+        backend.get_thumbnail(name, geometry, **options)
+
+
+def schedule(post):
+    '''Ставит нарезку миниатюр поста в очередь после коммита.'''
+    if post.image:
+        transaction.on_commit(lambda: _submit(post.pk))
+
+
+def _submit(post_id):
+    '''Отдаёт нарезку пулу; ``Future`` задачи или ``None``, если пула нет.'''
+    return background.submit(
+        'thumbnails', settings.THUMBNAIL_WORKERS, generate, post_id
+    )
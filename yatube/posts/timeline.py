@@ -0,0 +1,313 @@
+import hashlib
+import heapq
+from itertools import islice
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.functional import cached_property
+
+from core import background
+
+from .caching import (
+    author_feed,
+    bump_feed_versions,
+    feed_version,
+    follow_feed,
+    get_feed_count,
+)
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginators import keyset_filter
+
+# сколько записей вставляем за один INSERT при раздаче поста подписчикам
+FAN_OUT_BATCH_SIZE = 500
+
+POST_ORDERING = ('-pub_date', '-pk')
+INBOX_ORDERING = ('-pub_date', '-post_id')
+
+
+def is_celebrity(author_id):
+    '''Посты автора с огромным числом подписчиков не раздаются по лентам.'''
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_CELEBRITY_THRESHOLD,
+    ).exists()
+
+
+def fan_out_post(post):
+    '''Кладёт новый пост в ленты всех подписчиков автора.'''
+    if is_celebrity(post.author_id):
+        return
+    for user_ids in _follower_batches(post.author_id):
+        _push(post, user_ids)
+
+
+def touch_followers(post):
+    '''Сбрасывает ленты подписчиков после правки или удаления поста.'''
+    touch_author_followers(post.author_id)
+
+
+def touch_author_followers(author_id):
+    '''Сбрасывает ленты подписчиков автора, если в них видны его посты.'''
+    if is_celebrity(author_id):
+        # эти ленты и так зависят от версии ленты автора
+        return
+    for user_ids in _follower_batches(author_id):
+        bump_feed_versions(follow_feed(user_id) for user_id in user_ids)
+
+
+def _follower_batches(author_id):
+    follower_ids = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.append(user_id)
+        if len(batch) == FAN_OUT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _push(post, user_ids):
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+    bump_feed_versions(follow_feed(user_id) for user_id in user_ids)
+
+
+def backfill(user_id, author_id):
+    '''Докладывает в ленту последние посты нового автора подписки.'''
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        *POST_ORDERING
+    )[: settings.TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts.values_list('pk', 'pub_date')
+        ),
+        batch_size=FAN_OUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def catch_up_demoted(author_id):
+    '''Раздаёт посты автора, только что опустившегося до порога.
+
+    Пока подписчиков было больше ``TIMELINE_CELEBRITY_THRESHOLD``, его
+    посты не раздавались, а подтягивались при чтении. Ниже порога лента
+    читает только inbox, поэтому последние посты автора докладываются
+    подписчикам, как при новой подписке. Это до порога × backfill
+    записей, поэтому запрос только ставит раздачу в фоновый пул.
+    '''
+    demoted = AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_CELEBRITY_THRESHOLD,
+    ).exists()
+    if demoted:
+        transaction.on_commit(
+            lambda: background.submit(
+                'timeline', settings.TIMELINE_WORKERS, catch_up, author_id
+            )
+        )
+
+
+def catch_up(author_id):
+    '''Докладывает последние посты автора в ленты всех подписчиков.
+
+    Подписчики идут пачками по ``FAN_OUT_BATCH_SIZE``, записи
+    вставляются по столько же за INSERT.
+    '''
+    posts = list(
+        Post.objects.filter(author_id=author_id)
+        .order_by(*POST_ORDERING)
+        .values_list('pk', 'pub_date')[: settings.TIMELINE_BACKFILL]
+    )
+    for user_ids in _follower_batches(author_id):
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for user_id in user_ids
+                for pk, pub_date in posts
+            ),
+            batch_size=FAN_OUT_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        bump_feed_versions(follow_feed(user_id) for user_id in user_ids)
+
+
+def trim(user_id, author_id):
+    '''Убирает из ленты посты автора, от которого отписались.'''
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def _post_key(post):
+    if isinstance(post, dict):
+        return (post['pub_date'], post['pk'])
+    return (post.pub_date, post.pk)
+
+
+def _unique(posts):
+    '''Пропускает повторы одного поста, идущие подряд после слияния.'''
+    last_pk = None
+    for post in posts:
+        pk = _post_key(post)[1]
+        if pk != last_pk:
+            yield post
+        last_pk = pk
+
+
+def _inbox_row(row):
+    return {name[len('post__'):]: value for name, value in row.items()}
+
+
+class FollowTimeline:
+    '''Лента подписок: inbox читателя плюс посты «знаменитостей».
+
+    Посты авторов, у которых подписчиков больше
+    ``TIMELINE_CELEBRITY_THRESHOLD``, не раздаются при записи, а читаются
+    из их собственных отсортированных потоков и сливаются с inbox
+    k-way merge'ем по ключу ``(pub_date, pk)``. Так запись поста стоит
+    не больше порога, а чтение — один запрос на inbox и по одному
+    на каждую «знаменитость» из подписок.
+    '''
+
+    model = Post
+
+    def __init__(self, user, fields=None):
+        self.user = user
+        # с fields лента отдаёт строки values() вместо объектов Post;
+        # среди полей должны быть pub_date и pk
+        self.fields = fields
+
+    @cached_property
+    def celebrity_ids(self):
+        return list(
+            Follow.objects.filter(
+                user=self.user,
+                author__stats__followers_count__gt=(
+                    settings.TIMELINE_CELEBRITY_THRESHOLD
+                ),
+            ).values_list('author_id', flat=True)
+        )
+
+    @property
+    def feeds(self):
+        '''Ленты, от версий которых зависит эта лента.'''
+        return [follow_feed(self.user.pk)] + [
+            author_feed(author_id) for author_id in self.celebrity_ids
+        ]
+
+    def _streams(self):
+        if self.fields is not None:
+            yield from self._value_streams()
+            return
+        yield (
+            TimelineEntry.objects.filter(user=self.user).select_related(
+                'post__author', 'post__group'
+            ),
+            INBOX_ORDERING,
+            attrgetter('post'),
+        )
+        for author_id in self.celebrity_ids:
+            yield (
+                Post.objects.filter(author_id=author_id).select_related(
+                    'author', 'group'
+                ),
+                POST_ORDERING,
+                None,
+            )
+
+    def _value_streams(self):
+        yield (
+            TimelineEntry.objects.filter(user=self.user).values(
+                *(f'post__{field}' for field in self.fields)
+            ),
+            INBOX_ORDERING,
+            _inbox_row,
+        )
+        for author_id in self.celebrity_ids:
+            yield (
+                Post.objects.filter(author_id=author_id).values(*self.fields),
+                POST_ORDERING,
+                None,
+            )
+
+    def keyset_slice(self, values, reverse, limit):
+        '''Первые ``limit`` постов ленты после ключа ``values``.'''
+        streams = []
+        for queryset, ordering, to_post in self._streams():
+            queryset = queryset.order_by(*ordering)
+            if values is not None:
+                queryset = queryset.filter(
+                    keyset_filter(ordering, values, reverse)
+                )
+            if reverse:
+                queryset = queryset.reverse()
+            items = queryset[:limit]
+            streams.append(map(to_post, items) if to_post else items)
+        merged = heapq.merge(*streams, key=_post_key, reverse=not reverse)
+        return list(islice(_unique(merged), limit))
+
+    def count(self):
+        # раздаваемая часть кешируется под версией inbox: её меняют и
+        # раздача, и правка постов авторов подписки; подтягиваемая
+        # берётся из счётчиков авторов
+        inbox = TimelineEntry.objects.filter(user=self.user)
+        feed = follow_feed(self.user.pk)
+        key = f'{feed}:{feed_version(feed)}'
+        if not self.celebrity_ids:
+            return get_feed_count(key, inbox.count)
+        inbox = inbox.exclude(post__author_id__in=self.celebrity_ids)
+        pulled = AuthorStats.objects.filter(
+            user_id__in=self.celebrity_ids
+        ).aggregate(total=Sum('posts_count'))['total']
+        # inbox без «знаменитостей» — другое число: свой ключ, который
+        # меняется и со списком «знаменитостей»
+        excluded = hashlib.md5(
+            ','.join(map(str, sorted(self.celebrity_ids))).encode()
+        ).hexdigest()
+        return get_feed_count(
+            f'{key}:without:{excluded}', inbox.count
+        ) + (pulled or 0)
+
+    def __getitem__(self, index):
+        # Paginator режет ленту срезами [bottom:top]
+        if not isinstance(index, slice):
+            return self.keyset_slice(None, False, index + 1)[index]
+        return TimelineSlice(self, index)
+
+
+class TimelineSlice:
+    '''Срез ленты, который, как срез QuerySet, читается при первом
+    обращении: страница из кеша фрагментов ленту не читает.
+    '''
+
+    def __init__(self, timeline, index):
+        self.timeline = timeline
+        self.index = index
+
+    @cached_property
+    def posts(self):
+        return self.timeline.keyset_slice(None, False, self.index.stop)[
+            self.index
+        ]
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def __len__(self):
+        return len(self.posts)
+
+    def __getitem__(self, index):
+        return self.posts[index]
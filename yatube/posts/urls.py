@@ -1,21 +1,42 @@
 from django.urls import path
 
-from . import views
+from . import api, feeds, views
 
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('feed/', feeds.index_feed, name='index_feed'),
+    path('more/', views.index_more, name='index_more'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path('group/<slug:slug>/feed/', feeds.group_feed, name='group_feed'),
+    path('group/<slug:slug>/more/', views.group_more, name='group_more'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/feed/',
+        feeds.profile_feed,
+        name='profile_feed',
+    ),
+    path(
+        'profile/<str:username>/more/',
+        views.profile_more,
+        name='profile_more',
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments',
+    ),
     path(
         'posts/<int:post_id>/comment/', views.add_comment, name='add_comment'
     ),
+    path('search/', views.search, name='search'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/more/', views.follow_more, name='follow_more'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -26,4 +47,16 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow',
     ),
+    path('api/v1/posts/', api.index, name='api_index'),
+    path(
+        'api/v1/group/<slug:slug>/posts/',
+        api.group_posts,
+        name='api_group_posts',
+    ),
+    path(
+        'api/v1/profile/<str:username>/posts/',
+        api.profile,
+        name='api_profile',
+    ),
+    path('api/v1/follow/posts/', api.follow_index, name='api_follow_index'),
 ]
@@ -1,54 +1,224 @@
 from django.conf import settings
-from django.core.paginator import Paginator
 from django.contrib.auth import get_user_model
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 
+from core.cache import conditional_response, shared_page
+
+from . import thumbnails
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Comment, Follow, Group, Post, User
+from .caching import (
+    INDEX_FEED,
+    author_feed,
+    feed_version,
+    group_feed,
+    post_page,
+    version_timestamp,
+)
+from .paginators import CachedCountPaginator, CursorPaginator, LazyCursor
+from .search import SEARCH_ORDERING, SearchResults
+from .timeline import FollowTimeline
 
 User = get_user_model()
 
+# совпадает с индексом comment_post_created_idx (post, created, id)
+COMMENT_ORDERING = ('created', 'pk')
+
+
+def paginator(request, post_list, feed=None, max_pages=None):
+    '''Страница ленты: по курсору ``?cursor=``, если он передан,
+    иначе по номеру ``?page=``. По имени ленты ``feed`` число постов
+    берётся из кеша; номерных страниц не больше ``max_pages``, дальше
+    только курсор. Миниатюры картинок страницы читаются разом,
+    при первом обращении к ``page_obj.thumbnails``.
+    '''
+    cursor_paginator = CursorPaginator(post_list, settings.NUM_POSTS)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        page_obj = cursor_paginator.cursor_page(cursor)
+    else:
+        numbered = CachedCountPaginator(
+            cursor_paginator.object_list,
+            settings.NUM_POSTS,
+            feed=feed,
+            max_pages=max_pages,
+        )
+        page_obj = numbered.get_page(request.GET.get('page'))
+        # дальше листаем по курсору, чтобы глубокие страницы не шли
+        # через OFFSET
+        page_obj.next_cursor = None
+        if page_obj.has_next() or numbered.truncated:
+            page_obj.next_cursor = LazyCursor(cursor_paginator, page_obj)
+    page_obj.thumbnails = thumbnails.PageThumbnails(page_obj)
+    return page_obj
+
+
+def index_version(request):
+    return feed_version(INDEX_FEED)
+
+
+def group_version(request, slug):
+    group_id = get_object_or_404(
+        Group.objects.values_list('pk', flat=True), slug=slug
+    )
+    return feed_version(group_feed(group_id))
+
+
+def profile_version(request, username):
+    author_id = get_object_or_404(
+        User.objects.values_list('pk', flat=True), username=username
+    )
+    return feed_version(author_feed(author_id))
+
+
+def profile_holes(request, username):
+    following = (
+        request.user.is_authenticated
+        and request.user.follower.filter(author__username=username).exists()
+    )
+    return {'following': following}
+
+
+def feed_fragment(request, post_list, feeds, **flags):
+    '''Только карточки постов страницы после ``?cursor=`` — для
+    бесконечной прокрутки без base.html. Курсор следующей страницы
+    отдаётся в заголовке ``X-Next-Cursor``. ``flags`` — те же флаги
+    ``includes/post.html``, что и на странице ленты.
+    '''
+    version = feed_version(*feeds)
 
-def paginator(page_number, post_list):
-    paginator = Paginator(post_list, settings.NUM_POSTS)
-    return paginator.get_page(page_number)
+    def render_fragment():
+        page_obj = CursorPaginator(post_list, settings.NUM_POSTS).cursor_page(
+            request.GET.get('cursor')
+        )
+        page_obj.thumbnails = thumbnails.PageThumbnails(page_obj)
+        context = {
+            'page_obj': page_obj,
+            'feed': feeds[0],
+            'feed_version': version,
+            **flags,
+        }
+        response = render(request, 'posts/includes/post_list.html', context)
+        if page_obj.next_cursor:
+            response['X-Next-Cursor'] = page_obj.next_cursor
+        return response
+
+    return conditional_response(
+        request, version, version_timestamp, render_fragment
+    )
+
+
+def post_version(request, post_id):
+    author_id = get_object_or_404(
+        Post.objects.values_list('author_id', flat=True), pk=post_id
+    )
+    return feed_version(post_page(post_id), author_feed(author_id))
 
 
+def post_holes(request, post_id):
+    return {'form': CommentForm()}
+
+
+@shared_page(index_version, last_modified=version_timestamp)
 def index(request):
     post_list = Post.objects.select_related('group', 'author')
-    page_obj = paginator(request.GET.get('page'), post_list)
+    page_obj = paginator(request, post_list, INDEX_FEED)
     context = {
         'page_obj': page_obj,
+        'feed_version': feed_version(INDEX_FEED),
     }
     return render(request, 'posts/index.html', context)
 
 
+@shared_page(group_version, last_modified=version_timestamp)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_list = group.posts.select_related('author')
-    page_obj = paginator(request.GET.get('page'), post_list)
-    context = {'group': group, 'page_obj': page_obj}
+    page_obj = paginator(request, post_list, group_feed(group.pk))
+    context = {
+        'group': group,
+        'page_obj': page_obj,
+        'feed_version': feed_version(group_feed(group.pk)),
+    }
     return render(request, 'posts/group_list.html', context)
 
 
+@shared_page(
+    profile_version, profile_holes, last_modified=version_timestamp
+)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.select_related('group')
-    page_obj = paginator(request.GET.get('page'), post_list)
-    following = (
-        request.user.is_authenticated
-        and request.user.follower.filter(author=author).exists()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
     )
-    context = {'page_obj': page_obj, 'author': author, 'following': following}
+    post_list = author.posts.select_related('group')
+    page_obj = paginator(request, post_list, author_feed(author.pk))
+    context = {
+        'page_obj': page_obj,
+        'author': author,
+        'feed_version': feed_version(author_feed(author.pk)),
+    }
     return render(request, 'posts/profile.html', context)
 
 
+def comment_page(post_id, cursor=None):
+    '''Страница комментариев поста после курсора: короткое чтение
+    диапазона индекса ``(post, created, id)``.
+    '''
+    comments = (
+        Comment.objects.filter(post_id=post_id)
+        .select_related('author')
+        .only('text', 'created', 'post_id', 'author__username')
+    )
+    return CursorPaginator(
+        comments, settings.NUM_COMMENTS, ordering=COMMENT_ORDERING
+    ).cursor_page(cursor)
+
+
+def index_more(request):
+    return feed_fragment(
+        request,
+        Post.objects.select_related('group', 'author'),
+        [INDEX_FEED],
+        profile=True,
+        group_list=True,
+    )
+
+
+def group_more(request, slug):
+    group_id = get_object_or_404(
+        Group.objects.values_list('pk', flat=True), slug=slug
+    )
+    return feed_fragment(
+        request,
+        Post.objects.filter(group_id=group_id).select_related('author'),
+        [group_feed(group_id)],
+        profile=True,
+    )
+
+
+def profile_more(request, username):
+    author_id = get_object_or_404(
+        User.objects.values_list('pk', flat=True), username=username
+    )
+    return feed_fragment(
+        request,
+        Post.objects.filter(author_id=author_id).select_related('group'),
+        [author_feed(author_id)],
+        group_list=True,
+    )
+
+
+@shared_page(post_version, post_holes, last_modified=version_timestamp)
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects.select_related('group', 'author'), pk=post_id
+        Post.objects.select_related('group', 'author__stats'), pk=post_id
     )
-    comments = post.comments.select_related('author')
+    # первая страница комментариев — в самой странице, остальные
+    # догружаются через post_comments
+    comments = comment_page(post.pk)
     context = {
         'post': post,
         'form': CommentForm(),
@@ -57,32 +227,92 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    '''Следующая страница комментариев: HTML-фрагмент или JSON
+    (``?format=json``). Версия та же, что у страницы поста.
+    '''
+    version = post_version(request, post_id)
+
+    def render_comments():
+        comments = comment_page(post_id, request.GET.get('cursor'))
+        if request.GET.get('format') == 'json':
+            return JsonResponse(
+                {
+                    'comments': [
+                        {
+                            'id': comment.pk,
+                            'author': comment.author.username,
+                            'text': comment.text,
+                            'created': comment.created,
+                        }
+                        for comment in comments
+                    ],
+                    'next_cursor': comments.next_cursor,
+                }
+            )
+        context = {'comments': comments, 'post_id': post_id}
+        return render(request, 'posts/includes/comments.html', context)
+
+    return conditional_response(
+        request, version, version_timestamp, render_comments
+    )
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = CursorPaginator(
+        SearchResults(query), settings.NUM_POSTS, ordering=SEARCH_ORDERING
+    ).cursor_page(request.GET.get('cursor'))
+    page_obj.thumbnails = thumbnails.PageThumbnails(page_obj)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def post_form(request, **kwargs):
+    '''PostForm с ошибкой загрузки, если обработчик оборвал её.'''
+    # тело разбирается при первом обращении к POST, тогда же
+    # обработчик загрузки оставляет ошибку
+    data = request.POST or None
+    upload_error = getattr(request, 'upload_error', None)
+    if upload_error is not None:
+        # оборванная загрузка может не оставить ни одного поля, а ошибку
+        # можно добавить только в связанную форму
+        data = request.POST
+    form = PostForm(data, files=request.FILES or None, **kwargs)
+    if upload_error is not None:
+        form.add_error('image', upload_error)
+    return form
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
-    form = PostForm(
-        request.POST or None,
-        files=request.FILES or None,
-    )
+    form = post_form(request)
     if form.is_valid():
         create_post = form.save(commit=False)
         create_post.author = request.user
         create_post.save()
+        thumbnails.schedule(create_post)
         return redirect('posts:profile', create_post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     edit_post = get_object_or_404(
         Post.objects.select_related('author', 'group'), id=post_id
     )
     if request.user != edit_post.author:
         return redirect('posts:post_detail', post_id)
-    form = PostForm(
-        request.POST or None, files=request.FILES or None, instance=edit_post
-    )
+    form = post_form(request, instance=edit_post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(edit_post)
         return redirect('posts:post_detail', post_id)
     return render(
         request, 'posts/create_post.html', {'form': form, 'is_edit': True}
@@ -90,6 +320,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -103,15 +334,27 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('author', 'group')
-    page_obj = paginator(request.GET.get('page'), posts)
-    context = {'page_obj': page_obj}
+    timeline = FollowTimeline(request.user)
+    # срез [bottom:top] слитой ленты читает top строк из каждого потока,
+    # поэтому глубокие номерные страницы не отдаём
+    page_obj = paginator(
+        request, timeline, max_pages=settings.TIMELINE_MAX_PAGES
+    )
+    context = {
+        'page_obj': page_obj,
+        'feed_version': feed_version(*timeline.feeds),
+    }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+def follow_more(request):
+    timeline = FollowTimeline(request.user)
+    return feed_fragment(request, timeline, timeline.feeds)
+
+
+@login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -120,6 +363,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
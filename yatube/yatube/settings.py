@@ -26,7 +26,8 @@ SECRET_KEY = (
 )
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# в продакшене DJANGO_DEBUG=0: отладка выключается, шаблоны кешируются
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -35,12 +36,85 @@ ALLOWED_HOSTS = [
     'testserver',
 ]
 
+# версии лент, общие страницы и блокировки их пересборки должны быть
+# общими для всех воркеров, иначе запись в одном воркере не видна
+# остальным до PAGE_CACHE_TIMEOUT. В продакшене нужен общий кеш, например
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+# и CACHE_LOCATION=127.0.0.1:11211. LocMemCache у каждого процесса свой
+# и годится только для разработки в один процесс.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 NUM_POSTS = 10
+# сколько комментариев на странице поста и в каждой догрузке
+NUM_COMMENTS = 20
+# сколько последних постов отдавать в RSS и Atom
+FEED_ITEMS = 20
+# сколько номеров страниц показывать по обе стороны от текущей
+PAGE_WINDOW = 2
+# сколько секунд хранить в кеше число постов ленты
+FEED_COUNT_TIMEOUT = 60 * 60
+# сколько секунд хранить в кеше общие страницы лент и постов
+PAGE_CACHE_TIMEOUT = 6 * 60 * 60
+# сколько секунд после протухания кеша можно отдавать старое значение,
+# пока один воркер его пересобирает
+STAMPEDE_GRACE = 10
+# насколько охотно пересобирать кеш заранее (1 — по умолчанию в XFetch)
+STAMPEDE_BETA = 1.0
+# сколько последних постов автора попадает в ленту при подписке
+TIMELINE_BACKFILL = 200
+# авторов с большим числом подписчиков лента подтягивает при чтении
+TIMELINE_CELEBRITY_THRESHOLD = 1000
+# сколько номерных страниц у ленты подписок, дальше — только по курсору
+TIMELINE_MAX_PAGES = 10
+# сколько фоновых потоков раздают посты бывших «знаменитостей»
+# (0 — сразу после коммита)
+TIMELINE_WORKERS = 1
+# миниатюры картинок постов: имя -> (геометрия, опции sorl)
+POST_THUMBNAILS = {
+    'card-320': ('320x113', {'crop': 'center', 'upscale': True}),
+    'card-640': ('640x226', {'crop': 'center', 'upscale': True}),
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# размеры для srcset картинки поста, от меньшего к большему
+POST_IMAGE_SRCSET = ('card-320', 'card-640', 'card')
+# ширина картинки в ленте для атрибута sizes
+POST_IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+# загрузки пишутся сразу во временный файл и обрываются, как только
+# превысят лимиты или окажутся не картинкой
+FILE_UPLOAD_HANDLERS = ['core.uploads.ImageUploadHandler']
+MAX_IMAGE_UPLOAD_SIZE = 20 * 1024 * 1024
+MAX_IMAGE_PIXELS = 50 * 10 ** 6
+# сколько первых байт файла читать в поисках размеров картинки
+UPLOAD_HEADER_SIZE = 256 * 1024
+# загруженные картинки уменьшаются до этого размера по большей стороне
+POST_IMAGE_MAX_SIZE = 1920
+# и пересохраняются в WebP (или JPEG, если Pillow не умеет WebP)
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 85
+# сколько фоновых потоков нарезают миниатюры (0 — сразу после коммита)
+THUMBNAIL_WORKERS = 2
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# кто отправляет байты медиафайлов после проверок в posts.media:
+# None — сам Django (разработка), 'x-accel-redirect' — nginx,
+# 'x-sendfile' — Apache или lighttpd с mod_xsendfile
+MEDIA_SENDFILE = None
+# internal-location nginx, который смотрит в MEDIA_ROOT:
+#   location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# файлы с именем-хешем содержимого не меняются — кешируются на год
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MEDIA_MAX_AGE = 60 * 60
 # Application definition
 
 INSTALLED_APPS = [
@@ -69,13 +143,23 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    # шаблоны компилируются один раз на процесс, а не на каждый рендер;
+    # в разработке они перечитываются после правки
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',